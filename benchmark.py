@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+
+"""
+Times every generator on the headless backend across scaling sizes.
+
+Each case reports geometry, color, and render time separately, along with
+peak traced memory and segments per second. Results are written as JSON and
+can be compared against a saved baseline:
+
+    ./benchmark.py -o baseline.json
+    ./benchmark.py -b baseline.json
+
+With -i it instead times importing each module in a fresh interpreter.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import color_wheel
+import export
+import geometry_cache
+import turtle_tools as tt
+from color_wheel import ColorWheel
+from headless import HeadlessScreen, HeadlessTurtle
+
+
+def draw_color_runs(pen, points, runs):
+    """ Draws points as one polyline per run of get_color_runs. """
+    for start, stop, color in runs:
+        tt.draw_polyline(pen, points[start:stop + 1], color)
+
+
+def get_color_runs(data):
+    pen, points = data
+    count = len(points) - 1
+
+    return ColorWheel(count).get_color_runs(count)
+
+
+def hilbert_case(depth):
+    from hilbert import HilbertCurve
+
+    edge_length = 780
+
+    def geometry(screen):
+        pen = HeadlessTurtle(screen)
+        pen.penup()
+        pen.setpos(-edge_length / 2.0, -edge_length / 2.0)
+        pen.pendown()
+        hilbert = HilbertCurve(pen, edge_length, depth)
+
+        return pen, np.concatenate(list(hilbert.iterate_points(90)))
+
+    def render(data, runs):
+        draw_color_runs(*data, runs)
+
+    return geometry, get_color_runs, render
+
+
+def polyflake_case(side_count, limit):
+    import polyflake
+
+    length = 300
+
+    def geometry(screen):
+        return HeadlessTurtle(screen), np.concatenate(list(
+            polyflake.iterate_poly_flake_points(0, length, side_count, limit)))
+
+    def render(data, runs):
+        draw_color_runs(*data, runs)
+
+    return geometry, get_color_runs, render
+
+
+def trochoid_case(arm, pen):
+    from trochoid import Trochoid
+
+    def geometry(screen):
+        trochoid = Trochoid(pen=HeadlessTurtle(screen))
+        trochoid.set_radii(arm, pen, 350 / (arm + pen))
+
+        return trochoid.turtle, trochoid.compute_path()
+
+    def render(data, runs):
+        turtle, path = data
+        turtle.penup()
+        turtle.setpos(*path[0])
+        turtle.pendown()
+        draw_color_runs(turtle, path, runs)
+
+    return geometry, get_color_runs, render
+
+
+def linesets_case(point_count):
+    from linesets import HeadlessLineTurtle
+
+    def geometry(screen):
+        line_turtle = HeadlessLineTurtle(screen)
+        line_turtle.set_radius(380)
+        line_turtle.set_point_count(point_count)
+
+        return line_turtle, line_turtle.get_chord_segments(
+            line_turtle.get_oid_targets(2))
+
+    def color(data):
+        pass
+
+    def render(data, colors):
+        line_turtle, (starts, ends) = data
+        tt.draw_segments(line_turtle, starts, ends)
+
+    return geometry, color, render
+
+
+def shapes_case(count):
+    from shapes import get_circle_array
+
+    path_radius = 250
+    circle_radius = 120
+
+    def geometry(screen):
+        # The instanced path of Shapes.draw_circles_on_path when batched
+        centers = get_circle_array(path_radius, count)
+        circle = get_circle_array(circle_radius)
+
+        return HeadlessTurtle(screen), centers[:, np.newaxis, :] + circle
+
+    def color(data):
+        pen, instances = data
+
+        return ColorWheel(len(instances)).colors_for(len(instances)).tolist()
+
+    def render(data, colors):
+        pen, instances = data
+
+        for points, color in zip(instances, colors):
+            tt.draw_polyline(pen, points, color)
+
+    return geometry, color, render
+
+
+def complex_case(divisions):
+    from complex_turtle import HeadlessComplexTurtle
+
+    def geometry(screen):
+        # The orbit that draw_circle draws when batched
+        complex_turtle = HeadlessComplexTurtle(350, screen)
+        complex_turtle.assign(complex(1, 0))
+        step = complex(1, np.pi / divisions)
+        values = step ** np.arange(1, 2 * divisions + 1)
+
+        return complex_turtle, complex_turtle.get_visible_points(values)
+
+    def color(data):
+        pass
+
+    def render(data, colors):
+        tt.draw_polyline(*data)
+
+    return geometry, color, render
+
+
+CASES = {
+    'hilbert': [
+        (f'depth={depth}', hilbert_case, (depth,))
+        for depth in range(3, 11)],
+    'polyflake': [
+        (f'side_count={side_count},limit={limit}',
+         polyflake_case,
+         (side_count, limit))
+        for side_count in (3, 4)
+        for limit in range(1, 8)],
+    'trochoid': [
+        (f'arm={arm},pen={pen}', trochoid_case, (arm, pen))
+        for arm, pen in ((200, 70), (200, 71), (307, 97), (1009, 997))],
+    'linesets': [
+        (f'point_count={point_count}', linesets_case, (point_count,))
+        for point_count in (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5)],
+    'shapes': [
+        (f'count={count}', shapes_case, (count,))
+        for count in (42, 420, 4200)],
+    'complex_turtle': [
+        (f'divisions={divisions}', complex_case, (divisions,))
+        for divisions in (2 ** 6, 2 ** 9, 2 ** 12, 2 ** 15)],
+}
+
+
+MODULES = [
+    'turtle_tools',
+    'color_wheel',
+    'geometry_cache',
+    'sampling',
+    'instrument',
+    'headless',
+    'export',
+    'trochoid',
+    'shapes',
+    'hilbert',
+    'polyflake',
+    'linesets',
+    'complex_turtle',
+    'progressive',
+    'scene',
+    'pathfile',
+    'tiles',
+    'spatial_index',
+    'tk_turtles',
+]
+
+
+def measure_import(module):
+    """
+    Imports module in a new interpreter and returns its import time and
+    whether it loaded numpy and tkinter.
+    """
+    code = (
+        'import sys, time\n'
+        't = time.perf_counter()\n'
+        f'import {module}\n'
+        'print(time.perf_counter() - t, '
+        "'numpy' in sys.modules, 'tkinter' in sys.modules)")
+
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True).stdout.split()
+
+    return dict(
+        module=module,
+        import_seconds=float(output[0]),
+        loads_numpy=output[1] == 'True',
+        loads_tkinter=output[2] == 'True')
+
+
+def clear_caches():
+    geometry_cache.cache.clear()
+    color_wheel.get_palette.cache_clear()
+
+
+def run_phases(geometry, color, render, size):
+    """
+    Runs one case on a fresh screen. Each phase consumes what the one before
+    it returned, so that no work is timed twice: render only draws the
+    computed points and rasterizes the segments.
+    """
+    clear_caches()
+    screen = HeadlessScreen(size, size)
+    screen.bgcolor('black')
+    timings = {}
+
+    start = time.perf_counter()
+    data = geometry(screen)
+    timings['geometry_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    colors = color(data)
+    timings['color_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render(data, colors)
+    export.rasterize(*screen.segments.arrays(), (size, size))
+    timings['render_seconds'] = time.perf_counter() - start
+
+    return len(screen.segments), timings
+
+
+def run_case(generator, name, factory, args, size=800, repeat=1):
+    """ Returns the result of the fastest of repeat runs of one case. """
+    geometry, color, render = factory(*args)
+    best = None
+
+    for i in range(repeat):
+        segments, timings = run_phases(geometry, color, render, size)
+
+        if best is None or sum(timings.values()) < sum(best.values()):
+            best = timings
+
+    # Memory is measured in a separate run because tracing slows it down.
+    tracemalloc.start()
+    run_phases(geometry, color, render, size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(best.values())
+
+    return dict(
+        generator=generator,
+        name=name,
+        segments=segments,
+        **best,
+        total_seconds=total,
+        segments_per_second=segments / total if total > 0 else None,
+        peak_bytes=peak)
+
+
+def run(generators=None, max_cases=None, size=800, repeat=1):
+    for generator, cases in CASES.items():
+        if generators and generator not in generators:
+            continue
+
+        for name, factory, args in cases[:max_cases]:
+            yield run_case(generator, name, factory, args, size, repeat)
+
+
+def compare(results, baseline):
+    """
+    Returns (result, baseline_result, ratio) for each case in both runs,
+    where ratio is the total time relative to the baseline.
+    """
+    saved = {
+        (result['generator'], result['name']): result
+        for result in baseline['results']}
+
+    comparisons = []
+
+    for result in results:
+        previous = saved.get((result['generator'], result['name']))
+
+        if previous is None or not previous['total_seconds']:
+            continue
+
+        comparisons.append(
+            (result, previous,
+             result['total_seconds'] / previous['total_seconds']))
+
+    return comparisons
+
+
+def format_result(result):
+    return (
+        f"{result['generator']:>14} {result['name']:<24} "
+        f"{result['segments']:>9} segs  "
+        f"geometry {result['geometry_seconds']:8.4f} s  "
+        f"color {result['color_seconds']:8.4f} s  "
+        f"render {result['render_seconds']:8.4f} s  "
+        f"{(result['segments_per_second'] or 0):12.0f} seg/s  "
+        f"peak {result['peak_bytes'] / 2 ** 20:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+
+    parser.add_argument(
+        '-g',
+        '--generator',
+        action='append',
+        choices=sorted(CASES),
+        help='only run this generator (repeatable)')
+
+    parser.add_argument(
+        '-n',
+        '--max-cases',
+        type=int,
+        default=None,
+        help='only run the smallest N sizes of each generator')
+
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('-s', '--size', type=int, default=800)
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('-b', '--baseline', help='compare with saved JSON')
+
+    parser.add_argument(
+        '-i',
+        '--imports',
+        action='store_true',
+        help='time module imports instead of the generators')
+
+    parser.add_argument(
+        '-t',
+        '--threshold',
+        type=float,
+        default=1.2,
+        help='slowdown ratio reported as a regression')
+
+    args = parser.parse_args()
+
+    results = []
+    imports = []
+
+    if args.imports:
+        for module in MODULES:
+            timing = measure_import(module)
+            imports.append(timing)
+
+            print(
+                f"{module:>16} {timing['import_seconds'] * 1000:8.1f} ms"
+                f"{'  numpy' if timing['loads_numpy'] else ''}"
+                f"{'  tkinter' if timing['loads_tkinter'] else ''}")
+    else:
+        for result in run(
+                args.generator, args.max_cases, args.size, args.repeat):
+
+            print(format_result(result))
+            results.append(result)
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if imports:
+        report['imports'] = imports
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = 0
+
+        for result, previous, ratio in compare(results, baseline):
+
+            flag = ''
+
+            if ratio > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+
+            print(
+                f"{result['generator']:>14} {result['name']:<24} "
+                f"{previous['total_seconds']:8.4f} s -> "
+                f"{result['total_seconds']:8.4f} s  x{ratio:.2f}{flag}")
+
+        if regressions:
+            sys.exit(1)
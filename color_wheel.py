@@ -1,4 +1,54 @@
 import colorsys
+import functools
+
+# Wheels with a longer period compute their colors on demand instead of
+# caching a palette, which would hold 24 bytes per color.
+MAX_PALETTE_PERIOD = 2 ** 16
+
+
+def hsv_to_rgb(h, s, v):
+    """ Vectorized colorsys.hsv_to_rgb, returning an (..., 3) array. """
+    import numpy as np
+
+    h = np.asarray(h, dtype=np.float64)[..., np.newaxis]
+    s = np.asarray(s, dtype=np.float64)[..., np.newaxis]
+    v = np.asarray(v, dtype=np.float64)[..., np.newaxis]
+
+    # Position of each channel around the hue circle, in sixths.
+    k = (np.array([5.0, 3.0, 1.0]) + h * 6.0) % 6.0
+
+    return v - v * s * np.clip(np.minimum(k, 4.0 - k), 0.0, 1.0)
+
+
+@functools.lru_cache(maxsize=16)
+def get_palette(period):
+    """ Returns the read-only (period, 3) palette shared by all wheels. """
+    import numpy as np
+
+    palette = hsv_to_rgb(np.arange(period) / period, 1.0, 1.0)
+    palette.flags.writeable = False
+
+    return palette
+
+
+def get_hue_runs(hues, bucket_count=256):
+    """
+    Quantizes hues in [0, 1) to bucket_count buckets and returns runs of
+    (start, stop, color) like ColorWheel.get_color_runs.
+    """
+    import numpy as np
+
+    buckets = (np.asarray(hues) % 1.0 * bucket_count).astype(np.intp)
+    buckets = np.minimum(buckets, bucket_count - 1)
+    starts = np.flatnonzero(np.diff(buckets)) + 1
+    starts = np.concatenate(([0], starts)).tolist()
+    stops = starts[1:] + [len(buckets)]
+
+    return [
+        (start, stop, colorsys.hsv_to_rgb(
+            int(buckets[start]) / bucket_count, 1.0, 1.0))
+        for start, stop in zip(starts, stops)
+        if start < stop]
 
 
 class ColorWheel(object):
@@ -28,16 +78,68 @@ class ColorWheel(object):
     def reset(self):
         self._color_index = 0
 
-        self.color_values = [
-            colorsys.hsv_to_rgb(i * self.angle_delta, 1.0, 1.0)
-            for i in range(self.period)]
+    @property
+    def color_values(self):
+        # Built on first use, so that a wheel with a huge period costs
+        # nothing until colors are actually requested. Wheels longer than
+        # MAX_PALETTE_PERIOD never build it themselves.
+        return get_palette(self.period)
+
+    def indices_for(self, count):
+        """ Consumes the next count colors and returns their indices. """
+        import numpy as np
+
+        indices = (self._color_index + np.arange(count)) % self.period
+        self._color_index = (self._color_index + count) % self.period
+
+        return indices
+
+    def colors_for(self, count):
+        """ Consumes the next count colors as a (count, 3) array. """
+        return self._get_colors(self.indices_for(count))
+
+    def _get_colors(self, indices):
+        if self.period > MAX_PALETTE_PERIOD:
+            return hsv_to_rgb(indices / self.period, 1.0, 1.0)
+
+        return self.color_values[indices]
+
+    def get_color_runs(self, count, bucket_count=256):
+        """
+        Consumes the next count colors, quantized to bucket_count hues, and
+        returns them as runs of (start, stop, color), so that consecutive
+        items sharing a color can be drawn together.
+        """
+        runs = []
+        start = 0
+
+        while start < count:
+            index = (self._color_index + start) % self.period
+
+            if self.period > bucket_count:
+                bucket = index * bucket_count // self.period
+
+                # First wheel index that falls into the next bucket
+                next_index = -(-(bucket + 1) * self.period // bucket_count)
+                hue = bucket / bucket_count
+            else:
+                next_index = index + 1
+                hue = index * self.angle_delta
+
+            stop = min(start + next_index - index, count)
+            runs.append((start, stop, colorsys.hsv_to_rgb(hue, 1.0, 1.0)))
+            start = stop
+
+        self._color_index = (self._color_index + count) % self.period
+
+        return runs
 
     def get_next_color(self):
         if self._color_index >= self.period:
             self._color_index = 0
             return self.get_next_color()
 
-        color = self.color_values[self._color_index]
+        color = tuple(self._get_colors(self._color_index).tolist())
         self._color_index += 1
 
         return color
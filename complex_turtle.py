@@ -1,15 +1,22 @@
 #!/usr/bin/env python
 
-import turtle
-import numpy as np
+import cmath
+import math
+import instrument
+import turtle_tools as tt
 from color_wheel import ColorWheel
+from progressive import ProgressiveRenderer
+from headless import HeadlessTurtle
 
 
-class ComplexTurtle(turtle.Turtle):
-    def __init__(self, pixels_per_unit):
-        super(ComplexTurtle, self).__init__()
+class ComplexTurtleMixin:
+    """ Complex arithmetic drawing for the turtle.Turtle interface. """
+    def __init__(self, pixels_per_unit, *args, **kwargs):
+        super(ComplexTurtleMixin, self).__init__(*args, **kwargs)
         self._pixels_per_unit = pixels_per_unit
         self._value = complex(0, 0)
+        self.batched = False
+        self._renderer = None
         self.getscreen().bgcolor('black')
         self.shape('turtle')
         self.color('red')
@@ -29,67 +36,175 @@ class ComplexTurtle(turtle.Turtle):
             self.pendown()
 
     def set_position_complex(self, z):
-        self.setpos(np.real(z), np.imag(z))
+        self.setpos(z.real, z.imag)
 
     def get_position_complex(self):
         position = self.pos()
         return complex(position[0], position[1])
 
     def set_heading_complex(self, z):
-        self.setheading(np.angle(z, True))
+        self.setheading(math.degrees(cmath.phase(z)))
 
-    def __imul__(self, other):
-        self._value *= other
+    def move_to_value(self, value):
+        self._value = value
 
         delta = \
             self._value * self._pixels_per_unit - self.get_position_complex()
 
-        mag = np.absolute(delta)
+        mag = abs(delta)
         if (mag > 0.5):
             # change is large enough to be visible
             self.set_heading_complex(delta)
             self.forward(mag)
 
+    def __imul__(self, other):
+        self.move_to_value(self._value * other)
         return self
 
-    def __idiv__(self, other):
-        starting_value = self._value
-        self._value = starting_value / other
+    def __itruediv__(self, other):
+        self.move_to_value(self._value / other)
+        return self
 
-        delta = \
-            self._value * self._pixels_per_unit - self.get_position_complex()
+    # Python 2 name, kept for existing callers
+    __idiv__ = __itruediv__
 
-        mag = np.absolute(delta)
+    def get_visible_points(self, values):
+        """
+        Returns the pixel positions, as an (N, 2) array starting at the
+        current position, that moving through values one at a time would
+        draw. Like __imul__, moves of half a pixel or less are skipped: a
+        point is kept each time the path has covered another half pixel,
+        and the last point is always kept.
+        """
+        import numpy as np
 
-        if (mag > 0.5):
-            # change is large enough to be visible
-            self.set_heading_complex(delta)
-            self.forward(mag)
+        path = np.empty(len(values) + 1, dtype=complex)
+        path[0] = self.get_position_complex()
+        path[1:] = values
+        path[1:] *= self._pixels_per_unit
 
-        return self
+        travelled = np.cumsum(np.absolute(np.diff(path)))
+        buckets = np.floor(travelled / 0.5)
+
+        keep = np.flatnonzero(np.diff(buckets, prepend=0)) + 1
+        keep = np.union1d(np.concatenate(([0], keep)), [len(values)])
+        path = path[keep]
+
+        return np.stack((path.real, path.imag), axis=1)
+
+    def draw_values(self, values):
+        """ Moves through the complex values as one batched polyline. """
+        if len(values) == 0:
+            return
+
+        with instrument.phase('complex_turtle', 'geometry'):
+            points = self.get_visible_points(values)
+
+        self._value = complex(values[-1])
+        instrument.count('complex_turtle', 'segments', len(points) - 1)
+
+        if len(points) > 1:
+            with instrument.phase('complex_turtle', 'draw', self):
+                delta = points[-1] - points[-2]
+                self.set_heading_complex(complex(delta[0], delta[1]))
+                tt.draw_polyline(self, points)
+
+    def draw_orbit(self, step, count):
+        """
+        Does self *= step count times, computing the whole orbit as a
+        geometric series in one pass.
+        """
+        import numpy as np
+
+        self.draw_values(self._value * step ** np.arange(1, count + 1))
+
+    def draw_spiral(self, factors, divide=False):
+        """
+        Does self *= factor, or self /= factor if divide is set, for each
+        complex factor in turn, computing every value in one pass.
+        """
+        import numpy as np
+
+        factors = np.asarray(factors, dtype=complex)
+
+        if divide:
+            factors = 1 / factors
+
+        self.draw_values(self._value * np.cumprod(factors))
 
     def apply_rotation(self, divisions, count):
         self.assign(complex(1, 0))
         speed = self.speed()
-        step = complex(1, np.pi / divisions)
-
-        if speed:
-            # This is a value between 1 and 10.
-            for i in range(count):
-                self *= step
-                if i % (speed * 10) == 0:
-                    self.getscreen().update()
+        step = complex(1, math.pi / divisions)
+
+        if self.batched:
+            self.draw_orbit(step, count)
+        elif speed:
+            with instrument.phase('complex_turtle', 'draw', self):
+                # This is a value between 1 and 10.
+                for i in range(count):
+                    self *= step
+                    if i % (speed * 10) == 0:
+                        self.getscreen().update()
+                        instrument.count('complex_turtle', 'updates')
         else:
-            for i in range(count):
-                self *= step
+            with instrument.phase('complex_turtle', 'draw', self):
+                for i in range(count):
+                    self *= step
 
         self.getscreen().update()
+        instrument.count('complex_turtle', 'updates')
+
+    def apply_rotation_progressive(
+            self,
+            divisions,
+            count,
+            frame_time=1 / 60.0):
+        """
+        Like apply_rotation, but draws the orbit a frame at a time from the
+        screen's event loop and returns the ProgressiveRenderer. A render
+        still in progress from an earlier call is cancelled first.
+        """
+        import numpy as np
+
+        if self._renderer is not None:
+            self._renderer.cancel()
+
+        self.assign(complex(1, 0))
+        step = complex(1, np.pi / divisions)
+        values = self._value * step ** np.arange(1, count + 1)
+        points = self.get_visible_points(values)
+        self._value = complex(values[-1])
+
+        self._renderer = ProgressiveRenderer(
+            self,
+            np.array_split(points, max(len(points) // 4096, 1)),
+            frame_time)
+
+        return self._renderer.start()
 
     def draw_circle(self, divisions):
         self.apply_rotation(divisions, 2 * divisions)
 
 
+class HeadlessComplexTurtle(ComplexTurtleMixin, HeadlessTurtle):
+    pass
+
+
+def __getattr__(name):
+    # ComplexTurtle subclasses turtle.Turtle and lives in tk_turtles, so that
+    # importing this module does not load tkinter.
+    if name == 'ComplexTurtle':
+        import tk_turtles
+
+        return tk_turtles.ComplexTurtle
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 if __name__ == '__main__':
+    from tk_turtles import ComplexTurtle
+
     complex_turtle = ComplexTurtle(100)
     colors = ColorWheel(10)
 
@@ -0,0 +1,432 @@
+"""
+Writers for recorded line segments that do not need a Tk canvas.
+
+Segments are given as parallel arrays: starts and ends of shape (N, 2) in
+turtle coordinates (origin at the center, y up), colors of shape (N, 3) with
+components in [0, 1], and widths of shape (N,).
+"""
+
+import abc
+import struct
+import zlib
+
+import numpy as np
+
+
+def get_polyline_breaks(starts, ends, colors, widths):
+    """
+    Returns the indices at which a new polyline begins, so that consecutive
+    connected segments with the same color and width share one path.
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    is_break = np.ones(len(starts), dtype=bool)
+
+    is_break[1:] = \
+        np.any(starts[1:] != ends[:-1], axis=1) \
+        | np.any(colors[1:] != colors[:-1], axis=1) \
+        | (widths[1:] != widths[:-1])
+
+    return np.flatnonzero(is_break)
+
+
+def iterate_polylines(starts, ends, colors, widths):
+    """ Yields (points, color, width) for each merged polyline. """
+    breaks = get_polyline_breaks(starts, ends, colors, widths)
+    stops = np.append(breaks[1:], len(starts))
+
+    for start, stop in zip(breaks.tolist(), stops.tolist()):
+        points = np.concatenate((starts[start:start + 1], ends[start:stop]))
+        yield points, tuple(colors[start].tolist()), float(widths[start])
+
+
+def _to_byte_color(color):
+    return tuple(int(round(255 * c)) for c in color)
+
+
+def _get_pen_offsets(width):
+    radius = max(width, 1.0) / 2.0
+    extent = int(np.ceil(radius))
+    grid = np.arange(-extent, extent + 1)
+    dx, dy = np.meshgrid(grid, grid)
+    inside = dx ** 2 + dy ** 2 <= max(radius ** 2, 0.25)
+
+    return dx[inside], dy[inside]
+
+
+def rasterize(
+        starts,
+        ends,
+        colors,
+        widths,
+        size,
+        background=(1.0, 1.0, 1.0),
+        max_samples=2 ** 18):
+    """ Draws the segments into a new (height, width, 3) uint8 image. """
+    width, height = size
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:, :] = _to_byte_color(background)
+
+    draw_segments(image, starts, ends, colors, widths, None, max_samples)
+
+    return image
+
+
+def draw_segments(
+        image,
+        starts,
+        ends,
+        colors,
+        widths,
+        origin=None,
+        max_samples=2 ** 18):
+    """
+    Draws segments onto an existing image in place.
+
+    origin is the (column, row) of the turtle origin in image pixels. It
+    defaults to the center of the image. Segments are sampled once per pixel
+    of length, at most max_samples at a time.
+    """
+    height, width = image.shape[:2]
+
+    if origin is None:
+        origin = (width / 2.0, height / 2.0)
+
+    transform = np.asarray(origin, dtype=np.float64)
+
+    # Turtle coordinates have y pointing up.
+    flip = np.array([1.0, -1.0])
+
+    byte_colors = np.rint(np.asarray(colors) * 255).astype(np.uint8)
+    widths = np.asarray(widths)
+
+    for pen_width in np.unique(widths).tolist():
+        selected = np.flatnonzero(widths == pen_width)
+        dx, dy = _get_pen_offsets(pen_width)
+
+        p0 = np.asarray(starts[selected], dtype=np.float64) * flip + transform
+        p1 = np.asarray(ends[selected], dtype=np.float64) * flip + transform
+        lengths = np.ceil(np.abs(p1 - p0).max(axis=1)).astype(np.intp)
+        counts = lengths + 1
+
+        # Split so that no batch exceeds max_samples, except for a single
+        # segment that is longer by itself.
+        totals = np.cumsum(counts)
+        boundaries = np.searchsorted(
+            totals,
+            np.arange(max_samples, totals[-1], max_samples),
+            side='right')
+
+        boundaries = np.unique(np.concatenate(([0], boundaries, [len(p0)])))
+
+        for first, last in zip(boundaries[:-1], boundaries[1:]):
+            batch = slice(first, last)
+            batch_counts = counts[batch]
+            owner = np.repeat(np.arange(last - first), batch_counts)
+
+            # Position of each sample along its own segment, from 0 to 1.
+            first_sample = np.cumsum(batch_counts) - batch_counts
+            step = np.arange(len(owner)) - first_sample[owner]
+            t = step / np.maximum(lengths[batch], 1)[owner]
+
+            start = p0[batch][owner]
+            points = start + (p1[batch][owner] - start) * t[:, np.newaxis]
+            columns = np.rint(points[:, 0]).astype(np.intp)
+            rows = np.rint(points[:, 1]).astype(np.intp)
+
+            columns = (columns[:, np.newaxis] + dx).ravel()
+            rows = (rows[:, np.newaxis] + dy).ravel()
+
+            sample_colors = np.repeat(
+                byte_colors[selected[batch]][owner], len(dx), 0)
+
+            visible = \
+                (columns >= 0) & (columns < width) \
+                & (rows >= 0) & (rows < height)
+
+            image[rows[visible], columns[visible]] = sample_colors[visible]
+
+    return image
+
+
+def _png_chunk(kind, data):
+    return (
+        struct.pack('>I', len(data))
+        + kind
+        + data
+        + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+def write_png(filename, image, idat_size=2 ** 20):
+    """
+    Writes an (height, width, 3) uint8 image as an 8-bit RGB PNG.
+
+    Rows are compressed one at a time and written out in IDAT chunks of
+    about idat_size bytes, so image may be a memory map larger than RAM.
+    """
+    height, width = image.shape[:2]
+    compressor = zlib.compressobj(6)
+
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+
+        f.write(_png_chunk(
+            b'IHDR',
+            struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+
+        compressed = []
+        compressed_size = 0
+
+        for row in range(height):
+            # Each scanline is prefixed with filter type 0 (None).
+            data = compressor.compress(b'\x00' + image[row].tobytes())
+            compressed.append(data)
+            compressed_size += len(data)
+
+            if compressed_size >= idat_size:
+                f.write(_png_chunk(b'IDAT', b''.join(compressed)))
+                compressed = []
+                compressed_size = 0
+
+        compressed.append(compressor.flush())
+        f.write(_png_chunk(b'IDAT', b''.join(compressed)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def iterate_polyline_segments(point_chunks, color=(1.0, 1.0, 1.0), width=1):
+    """
+    Converts a stream of vertex chunks, like those from the generators'
+    iterate_points methods, into (starts, ends, colors, widths) chunks.
+    Consecutive chunks are joined into one polyline.
+    """
+    last_point = None
+
+    for points in point_chunks:
+        if last_point is not None:
+            points = np.concatenate((last_point, points))
+
+        if len(points) > 1:
+            count = len(points) - 1
+            colors = np.asarray(color, dtype=np.float32)
+
+            yield (
+                points[:-1],
+                points[1:],
+                np.broadcast_to(colors, (count, 3)),
+                np.full(count, width, dtype=np.float32))
+
+        last_point = points[-1:]
+
+
+def _format_number(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+def _format_point(point):
+    return f'{_format_number(point[0])} {_format_number(point[1])}'
+
+
+class VectorWriter(abc.ABC):
+    """
+    Streams polylines to a vector file without keeping them in memory.
+
+    Polylines that continue from the end of the previous one with the same
+    color and width are appended to the open path instead of starting a new
+    one. Use as a context manager, or call close when done.
+    """
+
+    def __init__(self, filename, size, background=(1.0, 1.0, 1.0)):
+        self.size = size
+        self.background = tuple(background)
+        self.path_count = 0
+        self.point_count = 0
+        self._file = open(filename, 'w')
+        self._style = None
+        self._last_point = None
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_header(self):
+        pass
+
+    def write_footer(self):
+        pass
+
+    @abc.abstractmethod
+    def begin_path(self, point, color, width):
+        """ Starts a path at point with the given stroke color and width. """
+
+    @abc.abstractmethod
+    def continue_path(self, coordinates):
+        """ Adds an (N, 2) array of points to the open path. """
+
+    @abc.abstractmethod
+    def end_path(self):
+        """ Strokes and closes off the open path. """
+
+    def add_polyline(self, points, color, width=1):
+        """ Adds an (N, 2) polyline in turtle coordinates. """
+        points = np.asarray(points)
+
+        if len(points) < 2:
+            return
+
+        style = (tuple(float(c) for c in color), float(width))
+        first = tuple(points[0].tolist())
+
+        if style != self._style or first != self._last_point:
+            self._end()
+            self.begin_path(_format_point(first), *style)
+            self._style = style
+            self.path_count += 1
+
+        self.continue_path([_format_point(p) for p in points[1:].tolist()])
+        self.point_count += len(points) - 1
+        self._last_point = tuple(points[-1].tolist())
+
+    def add_segments(self, starts, ends, colors, widths):
+        """ Adds segment arrays, merging connected runs of the same style. """
+        for points, color, width in iterate_polylines(
+                starts, ends, colors, widths):
+
+            self.add_polyline(points, color, width)
+
+    def add_points(self, point_chunks, color=(0.0, 0.0, 0.0), width=1):
+        """
+        Adds a stream of vertex chunks, like those from the generators'
+        iterate_points methods, as one polyline.
+        """
+        last_point = None
+
+        for points in point_chunks:
+            if last_point is not None:
+                points = np.concatenate((last_point, points))
+
+            self.add_polyline(points, color, width)
+            last_point = points[-1:]
+
+    def _end(self):
+        if self._style is not None:
+            self.end_path()
+            self._style = None
+            self._last_point = None
+
+    def close(self):
+        if self._file.closed:
+            return
+
+        self._end()
+        self.write_footer()
+        self._file.close()
+
+
+class SvgWriter(VectorWriter):
+    def write_header(self):
+        width, height = self.size
+
+        self._file.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'width="{width}" height="{height}" '
+            f'viewBox="{-width / 2.0} {-height / 2.0} {width} {height}">\n')
+
+        self._file.write(
+            '<rect x="{}" y="{}" width="{}" height="{}" '
+            'fill="#{:02x}{:02x}{:02x}"/>\n'.format(
+                -width / 2.0,
+                -height / 2.0,
+                width,
+                height,
+                *_to_byte_color(self.background)))
+
+        # Flip y so that turtle coordinates can be written unchanged.
+        self._file.write(
+            '<g transform="scale(1,-1)" fill="none" '
+            'stroke-linecap="round" stroke-linejoin="round">\n')
+
+    def write_footer(self):
+        self._file.write('</g>\n</svg>\n')
+
+    def begin_path(self, point, color, width):
+        self._file.write(
+            '<path stroke="#{:02x}{:02x}{:02x}" '.format(
+                *_to_byte_color(color))
+            + f'stroke-width="{_format_number(width)}" '
+            + f'd="M{point}')
+
+    def continue_path(self, coordinates):
+        self._file.write(' L' + ' L'.join(coordinates))
+
+    def end_path(self):
+        self._file.write('"/>\n')
+
+
+class EpsWriter(VectorWriter):
+    # Some PostScript interpreters limit the length of a path, so long runs
+    # are stroked in pieces.
+    max_path_points = 1000
+
+    def write_header(self):
+        width, height = self.size
+
+        self._file.write('%!PS-Adobe-3.0 EPSF-3.0\n')
+        self._file.write(f'%%BoundingBox: 0 0 {width} {height}\n')
+        self._file.write('%%EndComments\n')
+        self._file.write('1 setlinecap 1 setlinejoin\n')
+        self._file.write('{} {} {} setrgbcolor\n'.format(*self.background))
+        self._file.write(f'0 0 {width} {height} rectfill\n')
+        self._file.write(f'{width / 2.0} {height / 2.0} translate\n')
+
+    def write_footer(self):
+        self._file.write('showpage\n%%EOF\n')
+
+    def begin_path(self, point, color, width):
+        self._file.write('{} {} {} setrgbcolor '.format(*color))
+        self._file.write(f'{width} setlinewidth\n')
+        self._file.write(f'newpath {point} moveto\n')
+        self._path_points = 1
+
+    def continue_path(self, coordinates):
+        while coordinates:
+            room = self.max_path_points - self._path_points
+
+            if room <= 0:
+                # Restart the path at the current point.
+                self._file.write('currentpoint stroke moveto\n')
+                self._path_points = 1
+                continue
+
+            self._file.write(
+                ''.join(f'{c} lineto\n' for c in coordinates[:room]))
+
+            self._path_points += len(coordinates[:room])
+            coordinates = coordinates[room:]
+
+    def end_path(self):
+        self._file.write('stroke\n')
+
+
+def get_vector_writer(filename, size, background=(1.0, 1.0, 1.0)):
+    """ Opens an SvgWriter or EpsWriter based on the file extension. """
+    if filename.endswith('.svg'):
+        return SvgWriter(filename, size, background)
+
+    if filename.endswith('.eps') or filename.endswith('.ps'):
+        return EpsWriter(filename, size, background)
+
+    raise ValueError(f'Unsupported vector file type: {filename}')
+
+
+def write_eps(filename, starts, ends, colors, widths, size, background):
+    with EpsWriter(filename, size, background) as writer:
+        writer.add_segments(starts, ends, colors, widths)
+
+
+def write_svg(filename, starts, ends, colors, widths, size, background):
+    with SvgWriter(filename, size, background) as writer:
+        writer.add_segments(starts, ends, colors, widths)
@@ -0,0 +1,141 @@
+"""
+A shared cache of computed point arrays, keyed by the generator parameters.
+
+Arrays are kept in memory in least recently used order up to max_bytes. If a
+directory is configured, every computed array is also saved there as .npy,
+and later lookups, including from other processes, memory map it instead of
+recomputing.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class GeometryCache:
+    def __init__(self, max_bytes=256 * 2 ** 20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+
+        # Drawing code may share the cache between threads.
+        self._lock = threading.RLock()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (
+            self.directory is not None
+            and os.path.exists(self.get_filename(key)))
+
+    def get_filename(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f'{key[0]}-{digest}.npy')
+
+    def clear(self):
+        """ Empties the memory tier. Files on disk are left in place. """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _store(self, key, array):
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key).nbytes
+
+            if array.nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = array
+            self._nbytes += array.nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            array = self._entries.get(key)
+
+            if array is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return array
+
+        if self.directory is not None:
+            filename = self.get_filename(key)
+
+            if os.path.exists(filename):
+                array = np.load(filename, mmap_mode='r')
+                self._store(key, array)
+                self.hits += 1
+                return array
+
+        self.misses += 1
+
+        return default
+
+    def put(self, key, array):
+        """
+        Stores a read-only copy of array under key, which must be a tuple
+        starting with the generator name.
+        """
+        array = np.array(array)
+        array.flags.writeable = False
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Write to a temporary file first, so that a concurrent reader
+            # never maps a partial file.
+            handle, temporary = tempfile.mkstemp(
+                suffix='.npy',
+                dir=self.directory)
+
+            with os.fdopen(handle, 'wb') as f:
+                np.save(f, array)
+
+            os.replace(temporary, self.get_filename(key))
+
+        self._store(key, array)
+
+        return array
+
+    def get_or_compute(self, key, compute):
+        array = self.get(key)
+
+        if array is None:
+            array = self.put(key, compute())
+
+        return array
+
+
+cache = GeometryCache()
+
+
+def configure(max_bytes=None, directory=None):
+    """ Adjusts the shared cache used by the drawing classes. """
+    if max_bytes is not None:
+        cache.set_max_bytes(max_bytes)
+
+    if directory is not None:
+        cache.directory = directory
@@ -0,0 +1,441 @@
+"""
+A drop-in stand-in for turtle.Turtle and its screen that never touches Tk.
+
+Line segments are recorded into compact arrays instead of canvas items, and
+the screen can write them straight to PNG, EPS, or SVG.
+"""
+
+import itertools
+import math
+from array import array
+from collections import deque
+
+import instrument
+
+
+NAMED_COLORS = {
+    'black': (0.0, 0.0, 0.0),
+    'white': (1.0, 1.0, 1.0),
+    'red': (1.0, 0.0, 0.0),
+    'green': (0.0, 1.0, 0.0),
+    'blue': (0.0, 0.0, 1.0),
+    'yellow': (1.0, 1.0, 0.0),
+    'cyan': (0.0, 1.0, 1.0),
+    'magenta': (1.0, 0.0, 1.0),
+    'orange': (1.0, 0.647, 0.0),
+    'purple': (0.627, 0.125, 0.941),
+    'gray': (0.745, 0.745, 0.745),
+    'grey': (0.745, 0.745, 0.745),
+}
+
+# The same names turtle.RawTurtle.speed accepts.
+NAMED_SPEEDS = {
+    'fastest': 0,
+    'fast': 10,
+    'normal': 6,
+    'slow': 3,
+    'slowest': 1,
+}
+
+
+def to_rgb(color):
+    """ Converts a turtle color specification to an (r, g, b) float tuple. """
+    if isinstance(color, str):
+        if color.startswith('#') and len(color) == 7:
+            return tuple(int(color[i:i + 2], 16) / 255. for i in (1, 3, 5))
+
+        try:
+            return NAMED_COLORS[color.lower()]
+        except KeyError:
+            raise ValueError(f'bad color string: {color}')
+
+    r, g, b = color
+
+    return (float(r), float(g), float(b))
+
+
+class SegmentBuffer:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # x0, y0, x1, y1 for each segment
+        self._coordinates = array('f')
+        self._color_indices = array('I')
+        self._widths = array('f')
+
+        # The turtle that drew each segment, so it can erase only its own.
+        self._owners = array('I')
+
+        self.palette = []
+        self._palette_lookup = {}
+
+    def __len__(self):
+        return len(self._widths)
+
+    def get_color_index(self, rgb):
+        try:
+            return self._palette_lookup[rgb]
+        except KeyError:
+            index = len(self.palette)
+            self.palette.append(rgb)
+            self._palette_lookup[rgb] = index
+            return index
+
+    def append(self, start, end, rgb, width, owner=0):
+        self._coordinates.extend((start[0], start[1], end[0], end[1]))
+        self._color_indices.append(self.get_color_index(rgb))
+        self._widths.append(width)
+        self._owners.append(owner)
+
+    def extend(self, starts, ends, rgb, width, owner=0):
+        import numpy as np
+
+        coordinates = np.concatenate((starts, ends), axis=1)
+        self._coordinates.frombytes(coordinates.astype(np.float32).tobytes())
+
+        color_index = self.get_color_index(rgb)
+        self._color_indices.extend([color_index] * len(coordinates))
+        self._widths.extend([width] * len(coordinates))
+        self._owners.extend([owner] * len(coordinates))
+
+    def remove(self, owner):
+        """ Drops the segments drawn by owner, keeping the others in order. """
+        import numpy as np
+
+        keep = np.frombuffer(self._owners, dtype=np.uint32) != owner
+
+        if keep.all():
+            return
+
+        coordinates = np.frombuffer(self._coordinates, dtype=np.float32)
+        coordinates = coordinates.reshape(-1, 4)[keep]
+        color_indices = np.frombuffer(self._color_indices, dtype=np.uint32)
+        widths = np.frombuffer(self._widths, dtype=np.float32)
+        owners = np.frombuffer(self._owners, dtype=np.uint32)
+
+        self._coordinates = array('f', coordinates.tobytes())
+        self._color_indices = array('I', color_indices[keep].tobytes())
+        self._widths = array('f', widths[keep].tobytes())
+        self._owners = array('I', owners[keep].tobytes())
+
+    def arrays(self):
+        """
+        Returns (starts, ends, colors, widths) as NumPy arrays of shape
+        (N, 2), (N, 2), (N, 3) and (N,).
+
+        The arrays are copies, since a live view would stop the buffer from
+        growing while it is held.
+        """
+        import numpy as np
+
+        coordinates = np.frombuffer(self._coordinates, dtype=np.float32).copy()
+        coordinates = coordinates.reshape(-1, 4)
+        color_indices = np.frombuffer(self._color_indices, dtype=np.uint32)
+
+        palette = np.array(self.palette, dtype=np.float32).reshape(-1, 3)
+
+        return (
+            coordinates[:, :2],
+            coordinates[:, 2:],
+            palette[color_indices],
+            np.frombuffer(self._widths, dtype=np.float32).copy())
+
+
+class HeadlessScreen:
+    def __init__(self, width=800, height=800):
+        self.segments = SegmentBuffer()
+        self._width = width
+        self._height = height
+        self._bgcolor = 'white'
+        self._tracer = 1
+        self._delay = 10
+        self._timers = deque()
+
+    def setup(self, width=None, height=None):
+        if width is not None:
+            self._width = int(width)
+
+        if height is not None:
+            self._height = int(height)
+
+    def window_width(self):
+        return self._width
+
+    def window_height(self):
+        return self._height
+
+    def bgcolor(self, *args):
+        if not args:
+            return self._bgcolor
+
+        if len(args) == 1:
+            args = args[0]
+
+        to_rgb(args)
+        self._bgcolor = args
+
+    def tracer(self, n=None, delay=None):
+        if n is None:
+            return self._tracer
+
+        self._tracer = int(n)
+
+        if delay is not None:
+            self._delay = int(delay)
+
+    def update(self):
+        pass
+
+    def ontimer(self, fun, t=0):
+        """ Queues fun for mainloop. There is no clock, so t is ignored. """
+        self._timers.append(fun)
+
+    def mainloop(self):
+        """ Runs queued timer callbacks, in order, until none are left. """
+        while self._timers:
+            self._timers.popleft()()
+
+    def clear(self):
+        self.segments.clear()
+
+    def getcanvas(self):
+        # Lets scripts call screen.getcanvas().postscript(file=...) unchanged.
+        return self
+
+    def postscript(self, file=None, **kwargs):
+        if file is None:
+            raise ValueError('HeadlessScreen.postscript requires a file')
+
+        self.save(file)
+
+    def save(self, filename):
+        """ Writes the recorded segments to a .png, .eps, or .svg file. """
+        with instrument.phase('headless', 'export'):
+            self._save(filename)
+
+    def _save(self, filename):
+        import export
+
+        starts, ends, colors, widths = self.segments.arrays()
+        size = (self._width, self._height)
+        background = to_rgb(self._bgcolor)
+
+        if filename.endswith('.png'):
+            export.write_png(
+                filename,
+                export.rasterize(
+                    starts, ends, colors, widths, size, background))
+        elif filename.endswith('.eps') or filename.endswith('.ps'):
+            export.write_eps(
+                filename, starts, ends, colors, widths, size, background)
+        elif filename.endswith('.svg'):
+            export.write_svg(
+                filename, starts, ends, colors, widths, size, background)
+        else:
+            raise ValueError(f'Unsupported file type: {filename}')
+
+
+_default_screen = None
+
+
+def get_screen():
+    global _default_screen
+
+    if _default_screen is None:
+        _default_screen = HeadlessScreen()
+
+    return _default_screen
+
+
+_turtle_ids = itertools.count(1)
+
+
+class HeadlessTurtle:
+    def __init__(self, screen=None):
+        if screen is None:
+            screen = get_screen()
+
+        self.screen = screen
+        self._id = next(_turtle_ids)
+        self._shape = 'classic'
+        self._speed = 3
+        self._visible = True
+        self._reset_state()
+
+    def _reset_state(self):
+        self._position = (0.0, 0.0)
+        self._heading = 0.0
+        self._is_down = True
+        self._pensize = 1
+        self._pencolor = 'black'
+        self._fillcolor = 'black'
+        self._rgb = (0.0, 0.0, 0.0)
+
+    def reset(self):
+        self._reset_state()
+        self.clear()
+
+    def clear(self):
+        """ Erases this turtle's drawing, like turtle.Turtle.clear. """
+        self.screen.segments.remove(self._id)
+
+    def getscreen(self):
+        return self.screen
+
+    def shape(self, name=None):
+        if name is None:
+            return self._shape
+
+        self._shape = name
+
+    def speed(self, speed=None):
+        if speed is None:
+            return self._speed
+
+        if speed in NAMED_SPEEDS:
+            speed = NAMED_SPEEDS[speed]
+        elif 0.5 < speed < 10.5:
+            speed = int(round(speed))
+        else:
+            speed = 0
+
+        self._speed = speed
+
+    def hideturtle(self):
+        self._visible = False
+
+    def showturtle(self):
+        self._visible = True
+
+    def isvisible(self):
+        return self._visible
+
+    def pensize(self, width=None):
+        if width is None:
+            return self._pensize
+
+        self._pensize = width
+
+    width = pensize
+
+    def pencolor(self, *args):
+        if not args:
+            return self._pencolor
+
+        if len(args) == 1:
+            args = args[0]
+
+        self._rgb = to_rgb(args)
+        self._pencolor = args
+
+    def fillcolor(self, *args):
+        if not args:
+            return self._fillcolor
+
+        if len(args) == 1:
+            args = args[0]
+
+        to_rgb(args)
+        self._fillcolor = args
+
+    def color(self, *args):
+        if not args:
+            return self._pencolor, self._fillcolor
+
+        if len(args) == 2:
+            self.pencolor(args[0])
+            self.fillcolor(args[1])
+        else:
+            self.pencolor(*args)
+            self.fillcolor(*args)
+
+    def penup(self):
+        self._is_down = False
+
+    def pendown(self):
+        self._is_down = True
+
+    def isdown(self):
+        return self._is_down
+
+    pu = up = penup
+    pd = down = pendown
+
+    def pos(self):
+        return self._position
+
+    position = pos
+
+    def xcor(self):
+        return self._position[0]
+
+    def ycor(self):
+        return self._position[1]
+
+    def heading(self):
+        return self._heading
+
+    def setheading(self, to_angle):
+        self._heading = to_angle % 360.0
+
+    seth = setheading
+
+    def left(self, angle):
+        self.setheading(self._heading + angle)
+
+    def right(self, angle):
+        self.setheading(self._heading - angle)
+
+    lt = left
+    rt = right
+
+    def goto(self, x, y=None):
+        if y is None:
+            x, y = x
+
+        end = (float(x), float(y))
+
+        if self._is_down:
+            self.screen.segments.append(
+                self._position, end, self._rgb, self._pensize, self._id)
+
+        self._position = end
+
+    setpos = setposition = goto
+
+    def draw_polyline(self, points):
+        """ Records every segment of points at once and moves to the end. """
+        import numpy as np
+
+        points = np.asarray(points, dtype=np.float64)
+
+        if self._is_down:
+            self.screen.segments.extend(
+                points[:-1], points[1:], self._rgb, self._pensize, self._id)
+
+        self._position = tuple(points[-1].tolist())
+
+    def draw_segments(self, starts, ends):
+        """ Records unconnected segments without moving the turtle. """
+        import numpy as np
+
+        self.screen.segments.extend(
+            np.asarray(starts, dtype=np.float64),
+            np.asarray(ends, dtype=np.float64),
+            self._rgb,
+            self._pensize,
+            self._id)
+
+    def forward(self, distance):
+        radians = math.radians(self._heading)
+
+        self.goto(
+            self._position[0] + distance * math.cos(radians),
+            self._position[1] + distance * math.sin(radians))
+
+    def backward(self, distance):
+        self.forward(-distance)
+
+    fd = forward
+    bk = back = backward
@@ -1,8 +1,87 @@
 #!/usr/bin/env python
 
 
-import turtle
-from color_wheel import ColorWheel
+import math
+import numpy as np
+import export
+import geometry_cache
+import instrument
+import turtle_tools as tt
+from color_wheel import ColorWheel, get_hue_runs
+from headless import HeadlessScreen, HeadlessTurtle
+
+
+def get_hilbert_vertices(order, indices):
+    """
+    Maps indices along a Hilbert curve to (x, y) cells on a 2 ** order grid.
+
+    The curve starts at (0, 0), first moves in +y, and ends at
+    (2 ** order - 1, 0).
+    """
+    t = np.array(indices, dtype=np.int64)
+    x = np.zeros_like(t)
+    y = np.zeros_like(t)
+    size = 1
+
+    while size < 2 ** order:
+        rx = 1 & (t >> 1)
+        ry = 1 & (t ^ rx)
+
+        # Rotate the sub-curve into place.
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, size - 1 - x, x)
+        y = np.where(flip, size - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+
+        x += size * rx
+        y += size * ry
+        t >>= 2
+        size *= 2
+
+    return np.stack((x, y), axis=1)
+
+
+def _get_hilbert_vertex(order, index):
+    # Scalar get_hilbert_vertices, for use inside Python loops.
+    x = y = 0
+    size = 1
+
+    while size < 2 ** order:
+        rx = 1 & (index >> 1)
+        ry = 1 & (index ^ rx)
+
+        if ry == 0:
+            if rx == 1:
+                x = size - 1 - x
+                y = size - 1 - y
+
+            x, y = y, x
+
+        x += size * rx
+        y += size * ry
+        index >>= 2
+        size *= 2
+
+    return x, y
+
+
+def iterate_hilbert_vertices(order, chunk_size=65536):
+    """ Yields the Hilbert curve vertices in (k, 2) chunks. """
+    vertex_count = 4 ** order
+
+    for start in range(0, vertex_count, chunk_size):
+        yield get_hilbert_vertices(
+            order,
+            np.arange(start, min(start + chunk_size, vertex_count)))
+
+
+def get_hilbert_curve(order):
+    """ Returns all vertices of the curve, cached by order. """
+    return geometry_cache.cache.get_or_compute(
+        ('hilbert', order),
+        lambda: get_hilbert_vertices(order, np.arange(4 ** order)).astype(
+            np.int32))
 
 
 class HilbertCurve(object):
@@ -14,6 +93,11 @@ class HilbertCurve(object):
         self.segmentCount = 2 ** ((depth + 1) * 2) - 1
         self.colorWheel = ColorWheel(self.segmentCount)
 
+        # When batched, runs of segments that share a color are drawn as one
+        # canvas line item, with colors quantized to color_buckets hues.
+        self.batched = False
+        self.color_buckets = 256
+
     def draw_segment(self):
         self.turtle.color(self.colorWheel.get_next_color())
         self.turtle.forward(self.segment_length)
@@ -45,10 +129,245 @@ class HilbertCurve(object):
 
         self.turtle.right(-direction)
 
+    def iterate_points(self, direction, chunk_size=65536):
+        """
+        Yields the vertices that __call__ would visit, in (k, 2) chunks of
+        turtle coordinates, starting from the turtle's position and heading.
+        """
+        start, transform = self._get_transform(direction)
+
+        for vertices in iterate_hilbert_vertices(self.depth + 1, chunk_size):
+            yield start + vertices @ transform
+
+    def iterate_visible_points(
+            self,
+            direction,
+            viewport=None,
+            scale=1.0,
+            pixel_threshold=1.0,
+            chunk_size=65536,
+            with_indices=False):
+        """
+        Yields vertices like iterate_points, but a square block of the curve
+        that is smaller than pixel_threshold pixels, or lies outside the
+        viewport, is replaced by a segment from its first to its last
+        vertex.
+
+        viewport is (left, bottom, right, top) in turtle coordinates and
+        scale is pixels per unit. With with_indices, each chunk is a
+        (points, indices) pair, where indices are the vertices' positions
+        along the full curve.
+        """
+        order = self.depth + 1
+        start, transform = self._get_transform(direction)
+        (xx, xy), (yx, yy) = transform.tolist()
+        x0, y0 = start.tolist()
+        pixel_size = self.segment_length * scale
+
+        # Blocks up to this level are too small to be worth splitting.
+        detail_level = 0
+
+        while detail_level < order \
+                and (2 ** (detail_level + 1) - 1) * pixel_size \
+                < pixel_threshold:
+
+            detail_level += 1
+
+        detail_size = 4 ** detail_level
+        pending = []
+        pending_count = 0
+
+        # Each entry is a block of 4 ** level consecutive vertices, which
+        # fills a square of 2 ** level cells.
+        stack = [(order, 0)]
+
+        while stack:
+            level, first = stack.pop()
+            block_size = 4 ** level
+
+            if level == 0:
+                indices = [first]
+            elif level <= detail_level:
+                indices = [first, first + block_size - 1]
+            else:
+                side = 2 ** level
+
+                # The block is cell first // block_size of the coarser curve.
+                x, y = _get_hilbert_vertex(order - level, first // block_size)
+                x *= side
+                y *= side
+
+                # Bounding box of the transformed square
+                span = side - 1
+                corner_x = x0 + x * xx + y * yx
+                corner_y = y0 + x * xy + y * yy
+                left = corner_x + span * (min(xx, 0) + min(yx, 0))
+                right = corner_x + span * (max(xx, 0) + max(yx, 0))
+                bottom = corner_y + span * (min(xy, 0) + min(yy, 0))
+                top = corner_y + span * (max(xy, 0) + max(yy, 0))
+
+                is_inside = viewport is None or (
+                    left >= viewport[0] and right <= viewport[2]
+                    and bottom >= viewport[1] and top <= viewport[3])
+
+                if is_inside and block_size // detail_size <= chunk_size:
+                    # Every descendant is visible, so all of them are split
+                    # down to detail_level at once.
+                    starts = np.arange(first, first + block_size, detail_size)
+
+                    indices = np.stack(
+                        (starts, starts + detail_size - 1),
+                        axis=1).ravel()
+
+                    if detail_size == 1:
+                        indices = starts
+                elif tt.is_box_visible(left, bottom, right, top, viewport):
+                    block_size //= 4
+
+                    stack.extend(
+                        (level - 1, first + i * block_size)
+                        for i in (3, 2, 1, 0))
+
+                    continue
+                else:
+                    indices = [first, first + block_size - 1]
+
+            pending.append(indices)
+            pending_count += len(indices)
+
+            if pending_count >= chunk_size:
+                yield self._get_chunk(
+                    start, transform, np.concatenate(pending), with_indices)
+
+                pending = []
+                pending_count = 0
+
+        if pending:
+            yield self._get_chunk(
+                start, transform, np.concatenate(pending), with_indices)
+
+    def _get_chunk(self, start, transform, indices, with_indices):
+        points = start + get_hilbert_vertices(
+            self.depth + 1, indices) @ transform
+
+        if with_indices:
+            return points, np.asarray(indices)
+
+        return points
+
+    def draw_visible(
+            self,
+            direction,
+            viewport,
+            scale=1.0,
+            pixel_threshold=1.0):
+        """
+        Draws iterate_visible_points in the colors of the full curve. A
+        segment that replaces a block takes the color of the block's first
+        segment, quantized to color_buckets hues.
+        """
+        last_point = None
+        last_index = None
+        offset = self.colorWheel._color_index
+
+        for points, indices in self.iterate_visible_points(
+                direction,
+                viewport,
+                scale,
+                pixel_threshold,
+                with_indices=True):
+
+            if last_point is not None:
+                points = np.concatenate((last_point, points))
+                indices = np.concatenate((last_index, indices))
+
+            # Segment k starts at vertex indices[k] of the full curve.
+            hues = (offset + indices[:-1]) % self.colorWheel.period \
+                * self.colorWheel.angle_delta
+
+            for start, stop, color in get_hue_runs(hues, self.color_buckets):
+                tt.draw_polyline(self.turtle, points[start:stop + 1], color)
+
+            last_point = points[-1:]
+            last_index = indices[-1:]
+
+    def get_points(self, direction):
+        """ Returns every vertex of iterate_points as one (N, 2) array. """
+        start, transform = self._get_transform(direction)
+
+        return start + get_hilbert_curve(self.depth + 1) @ transform
+
+    def _get_transform(self, direction):
+        start = np.array(self.turtle.pos(), dtype=np.float64)
+        heading = math.radians(self.turtle.heading())
+        cos, sin = math.cos(heading), math.sin(heading)
+
+        # A negative direction mirrors the curve across the heading.
+        mirror = math.copysign(1.0, direction)
+
+        transform = self.segment_length * np.array(
+            [[cos, sin], [-mirror * sin, mirror * cos]])
+
+        return start, transform
+
+    def draw(self, direction, chunk_size=65536):
+        """ Draws the same curve as __call__ without recursion. """
+        instrument.count('hilbert', 'segments', 4 ** (self.depth + 1) - 1)
+
+        with instrument.phase('hilbert', 'draw', self.turtle):
+            if self.batched:
+                self.draw_batched(direction, chunk_size)
+            else:
+                self._draw_steps(direction, chunk_size)
+
+    def _draw_steps(self, direction, chunk_size):
+        heading = self.turtle.heading()
+        last_point = None
+
+        for points in self.iterate_points(direction, chunk_size):
+            if last_point is None:
+                last_point = points[:1]
+                points = points[1:]
+
+            headings = tt.get_headings(points, last_point)
+            colors = self.colorWheel.colors_for(len(points)).tolist()
+
+            for point, segment_heading, color in zip(
+                    points.tolist(), headings.tolist(), colors):
+
+                self.turtle.color(tuple(color))
+                self.turtle.setheading(segment_heading)
+                self.turtle.setpos(*point)
+
+            last_point = points[-1:]
+
+        self.turtle.setheading(heading)
+
+    def draw_batched(self, direction, chunk_size=65536):
+        last_point = None
+
+        for points in self.iterate_points(direction, chunk_size):
+            if last_point is not None:
+                points = np.concatenate((last_point, points))
+
+            for start, stop, color in self.colorWheel.get_color_runs(
+                    len(points) - 1,
+                    self.color_buckets):
+
+                tt.draw_polyline(self.turtle, points[start:stop + 1], color)
+
+            last_point = points[-1:]
+
+
+def get_new_turtle(initial_position=(0, 0), headless=False):
+    if headless:
+        t = HeadlessTurtle(HeadlessScreen())
+    else:
+        import turtle
+
+        turtle.clearscreen()
+        t = turtle.Turtle()
 
-def get_new_turtle(initial_position=(0, 0)):
-    turtle.clearscreen()
-    t = turtle.Turtle()
     t.shape("turtle")
     t.penup()
     t.setposition(*initial_position)
@@ -71,7 +390,12 @@ if __name__ == '__main__':
     t.getscreen().tracer(50)
 
     hilbert = HilbertCurve(t, 800, depth)
-    hilbert(90)
+
+    # Stream the same curve straight to a vector file, without Tk
+    with export.get_vector_writer('hilbert.svg', (850, 850), (0, 0, 0)) as w:
+        w.add_points(hilbert.iterate_points(90), color=(1, 1, 1))
+
+    hilbert.draw(90)
 
     t.getscreen().update()
 
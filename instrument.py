@@ -0,0 +1,165 @@
+"""
+Opt-in timing and counters for the drawing classes.
+
+Nothing is recorded until a sink is added. Each event is a dict with the
+source (the drawing module, like 'trochoid'), a kind of 'phase' or 'count',
+its name, and either seconds or a value:
+
+    collector = instrument.MemorySink()
+    instrument.add_sink(collector)
+    trochoid.draw()
+    collector.totals()
+
+Phases time geometry, color, draw, and export work. Counters record
+segments emitted, canvas items created, and screen updates.
+"""
+
+import contextlib
+import json
+import logging
+import time
+from collections import defaultdict
+
+
+logger = logging.getLogger(__name__)
+
+enabled = False
+_sinks = []
+_disabled_phase = contextlib.nullcontext()
+
+
+class MemorySink:
+    """ Keeps every event in a list, for tests and interactive use. """
+    def __init__(self):
+        self.events = []
+
+    def record(self, event):
+        self.events.append(event)
+
+    def totals(self):
+        """ Sums seconds or values by (source, name). """
+        totals = defaultdict(float)
+
+        for event in self.events:
+            key = (event['source'], event['name'])
+            totals[key] += event.get('seconds', event.get('value', 0))
+
+        return dict(totals)
+
+    def clear(self):
+        self.events = []
+
+    def close(self):
+        pass
+
+
+class LogSink:
+    """ Writes each event to a logging.Logger. """
+    def __init__(self, log=logger, level=logging.INFO):
+        self.log = log
+        self.level = level
+
+    def record(self, event):
+        if event['kind'] == 'phase':
+            self.log.log(
+                self.level,
+                '%s %s: %.6f s',
+                event['source'],
+                event['name'],
+                event['seconds'])
+        else:
+            self.log.log(
+                self.level,
+                '%s %s: %d',
+                event['source'],
+                event['name'],
+                event['value'])
+
+    def close(self):
+        pass
+
+
+class JsonSink:
+    """ Appends each event to a file as one line of JSON. """
+    def __init__(self, filename):
+        self._file = open(filename, 'a')
+
+    def record(self, event):
+        self._file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def add_sink(sink):
+    global enabled
+
+    _sinks.append(sink)
+    enabled = True
+
+    return sink
+
+
+def remove_sink(sink):
+    """ Detaches and closes sink. """
+    global enabled
+
+    _sinks.remove(sink)
+    enabled = bool(_sinks)
+    sink.close()
+
+
+def _emit(event):
+    event['time'] = time.time()
+
+    for sink in _sinks:
+        sink.record(event)
+
+
+def count(source, name, value=1):
+    if not enabled:
+        return
+
+    _emit({'source': source, 'kind': 'count', 'name': name, 'value': value})
+
+
+class _Phase:
+    def __init__(self, source, name, pen):
+        self.source = source
+        self.name = name
+
+        # Tk turtles keep a list of the canvas items they have created.
+        # Other pens have no canvas, so there is nothing to count.
+        self.pen = pen if hasattr(pen, 'items') else None
+
+    def __enter__(self):
+        if self.pen is not None:
+            self._items = len(self.pen.items)
+
+        self._start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start
+
+        _emit({
+            'source': self.source,
+            'kind': 'phase',
+            'name': self.name,
+            'seconds': seconds})
+
+        if self.pen is not None:
+            items = len(self.pen.items) - self._items
+            count(self.source, 'canvas_items', items)
+
+
+def phase(source, name, pen=None):
+    """
+    Returns a context manager that times a phase. If pen is a Tk turtle,
+    the canvas items it creates during the phase are counted too.
+    """
+    if not enabled:
+        return _disabled_phase
+
+    return _Phase(source, name, pen)
@@ -1,31 +1,50 @@
 #!/usr/bin/env python
 
 
-import turtle
 import colorsys
 import math
+import numpy as np
+import instrument
+import turtle_tools as tt
+from headless import HeadlessTurtle
 
 
-class LineTurtle(turtle.Turtle):
+class LineSetMixin:
+    """ Chord drawing for any class with the turtle.Turtle interface. """
     def __init__(self, *args, **kwargs):
-        super(LineTurtle, self).__init__(*args, **kwargs)
+        super(LineSetMixin, self).__init__(*args, **kwargs)
 
         self._center = (0, 0)
         self._radius = 200
         self._point_count = 180
         self.set_point_count(self._point_count)
 
+        # When batched, all chords are drawn in one operation instead of
+        # moving the turtle along each one.
+        self.batched = False
+
         self.speed(10)
 
     def _create_points(self):
         angle_delta = 2 * math.pi / self._point_count
-        sub_angles = [0.0] * self._point_count
-        for i in range(self._point_count):
-            sub_angles[i] = angle_delta * i
-        self._points = [(
-            self._center[0] + self._radius * math.cos(q * angle_delta),
-            self._center[1] + self._radius * math.sin(q * angle_delta))
-            for q in range(self._point_count)]
+        angles = np.arange(self._point_count) * angle_delta
+
+        self._points = np.empty((self._point_count, 2))
+        self._points[:, 0] = self._center[0] + self._radius * np.cos(angles)
+        self._points[:, 1] = self._center[1] + self._radius * np.sin(angles)
+
+    def get_circle_targets(self, skip=10):
+        # The points are on a circle, so values higher than
+        # self._point_count wrap around to the front of the point list
+        indices = np.arange(self._point_count)
+
+        return (indices + int(self._point_count / 2) + skip + 1) \
+            % self._point_count
+
+    def get_oid_targets(self, skip=2):
+        indices = np.arange(self._point_count)
+
+        return (indices + 2 + indices * skip) % self._point_count
 
     def set_center(self, x, y):
         self._center = (x, y)
@@ -52,29 +71,33 @@ class LineTurtle(turtle.Turtle):
         heading_degrees = 180 * heading_radians / math.pi
         self.setheading(heading_degrees)
 
+    def get_chord_segments(self, targets):
+        """ Returns the (starts, ends) of the chords draw_chords draws. """
+        return self._points, self._points[targets]
+
+    def draw_chords(self, targets):
+        """ Draws a chord from every point to the point at its target. """
+        instrument.count('linesets', 'segments', len(targets))
+
+        with instrument.phase('linesets', 'draw', self):
+            if self.batched:
+                tt.draw_segments(self, self._points, self._points[targets])
+                return
+
+            for point, target in zip(
+                    self._points.tolist(),
+                    self._points[targets].tolist()):
+
+                self.penup()
+                self.setpos(point[0], point[1])
+                self.pendown()
+                self.setpos(target[0], target[1])
+
     def draw_circle(self, skip=10):
-        for index, point in enumerate(self._points):
-            starting_point = point
-            target_point_index = \
-                (index + int(self._point_count / 2) + skip + 1)
-
-            # The points are on a circle, so values higher than
-            # self._point_count wrap around to the front of the point list
-            target_point_index = target_point_index % (self._point_count)
-            target_point = self._points[target_point_index]
-            self.penup()
-            self.setpos(starting_point[0], starting_point[1])
-            self.pendown()
-            self.setpos(target_point[0], target_point[1])
+        self.draw_chords(self.get_circle_targets(skip))
 
     def draw_oid(self, skip=2):
-        for index, point in enumerate(self._points):
-            target_index = (index + 2 + index * skip) % self._point_count
-            target = self._points[target_index]
-            self.penup()
-            self.setpos(point[0], point[1])
-            self.pendown()
-            self.setpos(target[0], target[1])
+        self.draw_chords(self.get_oid_targets(skip))
 
     def draw_points(self, point_size=2):
         self.setheading(90)
@@ -89,7 +112,24 @@ class LineTurtle(turtle.Turtle):
         self.pensize(save_the_pen_size)
 
 
+class HeadlessLineTurtle(LineSetMixin, HeadlessTurtle):
+    pass
+
+
+def __getattr__(name):
+    # LineTurtle subclasses turtle.Turtle and lives in tk_turtles, so that
+    # importing this module does not load tkinter.
+    if name == 'LineTurtle':
+        import tk_turtles
+
+        return tk_turtles.LineTurtle
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 if __name__ == '__main__':
+    from tk_turtles import LineTurtle
+
     line_turtle = LineTurtle()
     screen = line_turtle.getscreen()
     screen.bgcolor('black')
@@ -0,0 +1,452 @@
+"""
+A compact file format for generated curves, so they can be replayed,
+restyled, or exported again without recomputing them.
+
+A path file is an uncompressed .npz archive, readable with np.load, holding:
+
+    points.npy      (N, 2) float32 vertices of every polyline, concatenated
+    breaks.npy      (P,) int64 index into points where each polyline starts
+    colors.npy      (N,) uint8 palette index of the segment ending at each
+                    point (uint16 if the palette has more than 256 colors)
+    palette.npy     (K, 3) uint8 RGB colors
+    widths.npy      (P,) float32 pen width of each polyline
+    size.npy        (2,) int32 canvas width and height
+    background.npy  (3,) float32 background RGB
+
+PathWriter streams polylines to disk, and PathFile memory maps each member
+straight out of the archive, so neither holds the whole curve in memory.
+"""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+
+import export
+import turtle_tools as tt
+from color_wheel import ColorWheel
+from headless import to_rgb
+
+
+def _to_byte_colors(colors, count):
+    if isinstance(colors, str):
+        colors = to_rgb(colors)
+
+    colors = np.asarray(colors, dtype=np.float64)
+
+    if colors.ndim == 1:
+        colors = np.broadcast_to(colors, (count, 3))
+
+    return np.rint(colors * 255).astype(np.uint8)
+
+
+class PathWriter:
+    """
+    Writes polylines to a path file as they are added. Members are spooled
+    to temporary files and packed into the archive by close.
+    """
+    def __init__(
+            self,
+            filename,
+            size=(800, 800),
+            background=(0.0, 0.0, 0.0),
+            temporary_directory=None):
+
+        self.filename = filename
+        self.size = size
+        self.background = to_rgb(background)
+        self.point_count = 0
+        self.polyline_count = 0
+        self.palette = []
+        self._palette_lookup = {}
+        self._directory = tempfile.mkdtemp(dir=temporary_directory)
+
+        self._files = {
+            name: open(os.path.join(self._directory, name), 'wb')
+            for name in ('points', 'breaks', 'colors', 'widths')}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_color_indices(self, byte_colors):
+        keys = byte_colors.astype(np.uint32) @ np.array([1 << 16, 1 << 8, 1])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        lookup = np.empty(len(unique_keys), dtype=np.uint16)
+
+        for i, key in enumerate(unique_keys.tolist()):
+            try:
+                lookup[i] = self._palette_lookup[key]
+            except KeyError:
+                if len(self.palette) == 2 ** 16:
+                    raise ValueError('Path files hold at most 65536 colors')
+
+                lookup[i] = self._palette_lookup[key] = len(self.palette)
+                self.palette.append((key >> 16, (key >> 8) & 255, key & 255))
+
+        return lookup[inverse.ravel()]
+
+    def _write(self, points, colors, width, is_new):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+
+        if is_new:
+            self._files['breaks'].write(
+                struct.pack('<q', self.point_count))
+
+            self._files['widths'].write(struct.pack('<f', width))
+            self.polyline_count += 1
+
+            # The first point ends no segment, so it repeats the first color.
+            segment_count = len(points) - 1
+            byte_colors = _to_byte_colors(colors, segment_count)
+            byte_colors = np.concatenate((byte_colors[:1], byte_colors))
+        else:
+            byte_colors = _to_byte_colors(colors, len(points))
+
+        self._files['points'].write(points.tobytes())
+
+        self._files['colors'].write(
+            self._get_color_indices(byte_colors).tobytes())
+
+        self.point_count += len(points)
+
+    def add_polyline(self, points, colors, width=1):
+        """
+        Adds an (N, 2) polyline. colors is one color for the whole line or
+        an (N - 1, 3) array with the color of each segment.
+        """
+        if len(points) < 2:
+            return
+
+        self._write(points, colors, width, True)
+
+    def add_segments(self, starts, ends, colors, width=1):
+        """
+        Adds unconnected segments as two point polylines. colors is one
+        color or an (N, 3) array with the color of each segment.
+        """
+        count = len(starts)
+
+        if count == 0:
+            return
+
+        points = np.stack(
+            (np.asarray(starts, dtype=np.float32),
+             np.asarray(ends, dtype=np.float32)),
+            axis=1)
+
+        breaks = self.point_count + 2 * np.arange(count, dtype=np.int64)
+        byte_colors = np.repeat(_to_byte_colors(colors, count), 2, axis=0)
+
+        self._files['breaks'].write(breaks.astype('<i8').tobytes())
+
+        self._files['widths'].write(
+            np.full(count, width, dtype='<f4').tobytes())
+
+        self._files['points'].write(points.tobytes())
+
+        self._files['colors'].write(
+            self._get_color_indices(byte_colors).tobytes())
+
+        self.point_count += 2 * count
+        self.polyline_count += count
+
+    def add_points(self, point_chunks, colors, width=1):
+        """
+        Adds a stream of vertex chunks as one polyline. colors is one color,
+        or a function of a segment count that returns that many colors.
+        """
+        is_new = True
+
+        for points in point_chunks:
+            count = len(points) - 1 if is_new else len(points)
+
+            if count <= 0:
+                continue
+
+            self._write(
+                points,
+                colors(count) if callable(colors) else colors,
+                width,
+                is_new)
+
+            is_new = False
+
+    def close(self):
+        if self._directory is None:
+            return
+
+        for f in self._files.values():
+            f.close()
+
+        try:
+            self._pack()
+        finally:
+            shutil.rmtree(self._directory)
+            self._directory = None
+
+    def _pack(self):
+        color_dtype = np.uint8 if len(self.palette) <= 256 else np.uint16
+
+        members = [
+            ('points', np.float32, (self.point_count, 2)),
+            ('breaks', np.int64, (self.polyline_count,)),
+            ('colors', color_dtype, (self.point_count,)),
+            ('widths', np.float32, (self.polyline_count,)),
+        ]
+
+        with zipfile.ZipFile(
+                self.filename,
+                'w',
+                zipfile.ZIP_STORED,
+                allowZip64=True) as archive:
+
+            for name, dtype, shape in members:
+                source = os.path.join(self._directory, name)
+                spooled = np.uint16 if name == 'colors' else dtype
+
+                header = {
+                    'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                    'fortran_order': False,
+                    'shape': shape}
+
+                if os.path.getsize(source):
+                    data = np.memmap(source, dtype=spooled, mode='r')
+                else:
+                    data = np.zeros(0, dtype=spooled)
+
+                with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array_header_2_0(f, header)
+
+                    for start in range(0, len(data), 2 ** 22):
+                        chunk = data[start:start + 2 ** 22]
+                        f.write(chunk.astype(dtype).tobytes())
+
+                del data
+
+            small = {
+                'palette': np.array(self.palette, np.uint8).reshape(-1, 3),
+                'size': np.array(self.size, dtype=np.int32),
+                'background': np.array(self.background, dtype=np.float32),
+            }
+
+            for name, array in small.items():
+                buffer = io.BytesIO()
+                np.save(buffer, array)
+                archive.writestr(name + '.npy', buffer.getvalue())
+
+
+def _map_member(filename, archive, name):
+    """ Memory maps a stored .npy member of a zip archive in place. """
+    info = archive.getinfo(name + '.npy')
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as f:
+            return np.lib.format.read_array(f)
+
+    with open(filename, 'rb') as f:
+        # The data follows the 30 byte local header, the name, and the extra
+        # field, whose lengths are at its end.
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', f.read(4))
+        f.seek(name_length + extra_length, os.SEEK_CUR)
+
+        version = np.lib.format.read_magic(f)
+
+        if version == (1, 0):
+            shape, fortran_order, dtype = \
+                np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = \
+                np.lib.format.read_array_header_2_0(f)
+
+        offset = f.tell()
+
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+
+    return np.memmap(
+        filename,
+        dtype=dtype,
+        mode='r',
+        offset=offset,
+        shape=shape,
+        order='F' if fortran_order else 'C')
+
+
+class PathFile:
+    """ Reads a path file, memory mapping its arrays. """
+    def __init__(self, filename):
+        self.filename = filename
+
+        with zipfile.ZipFile(filename) as archive:
+            for name in (
+                    'points',
+                    'breaks',
+                    'colors',
+                    'palette',
+                    'widths',
+                    'size',
+                    'background'):
+
+                setattr(self, name, _map_member(filename, archive, name))
+
+        self.size = tuple(self.size.tolist())
+        self.background = tuple(self.background.tolist())
+
+    def __len__(self):
+        """ Returns the number of segments. """
+        return max(len(self.points) - len(self.breaks), 0)
+
+    def iterate_segments(self, chunk_size=2 ** 20):
+        """
+        Yields (starts, ends, colors, widths) chunks of about chunk_size
+        segments, the form export and tiles take.
+        """
+        rgb = np.asarray(self.palette, dtype=np.float32) / 255.0
+
+        for first in range(0, len(self.points) - 1, chunk_size):
+            last = min(first + chunk_size, len(self.points) - 1)
+
+            # Segments end at points first + 1 through last, except where
+            # a new polyline starts.
+            end_indices = np.arange(first + 1, last + 1)
+            low, high = np.searchsorted(self.breaks, [first + 1, last + 1])
+            valid = np.ones(len(end_indices), dtype=bool)
+            valid[self.breaks[low:high] - (first + 1)] = False
+
+            points = np.asarray(self.points[first:last + 1])
+            end_indices = end_indices[valid]
+
+            owners = np.searchsorted(
+                self.breaks, end_indices, side='right') - 1
+
+            yield (
+                points[:-1][valid],
+                points[1:][valid],
+                rgb[self.colors[end_indices]],
+                np.asarray(self.widths)[owners])
+
+    def replay(self, pen, chunk_size=2 ** 20):
+        """ Draws the recorded curves with pen, one polyline per run. """
+        is_down = pen.isdown()
+        pen.pendown()
+
+        for chunk in self.iterate_segments(chunk_size):
+            for points, color, width in export.iterate_polylines(*chunk):
+                pen.pensize(width)
+                tt.draw_polyline(pen, points, color)
+
+        if not is_down:
+            pen.penup()
+
+        pen.getscreen().update()
+
+    def export(self, filename, **kwargs):
+        """
+        Writes the curves as .png, through the tiled rasterizer, or as .svg
+        or .eps, streaming either way.
+        """
+        if filename.endswith('.png'):
+            import tiles
+
+            return tiles.render_tiled(
+                self.iterate_segments(),
+                self.size,
+                filename,
+                background=self.background,
+                **kwargs)
+
+        with export.get_vector_writer(
+                filename, self.size, self.background) as writer:
+
+            for chunk in self.iterate_segments():
+                writer.add_segments(*chunk)
+
+        return filename
+
+
+def write_trochoid(
+        filename,
+        trochoid,
+        rainbow_count=1,
+        size=(800, 800),
+        width=1):
+    """ Saves the curve trochoid.draw would draw. """
+    path = trochoid.compute_path()
+    color_wheel = ColorWheel(len(path) / rainbow_count)
+
+    colors = _get_run_colors(
+        color_wheel, len(path) - 1, trochoid.color_buckets)
+
+    with PathWriter(filename, size) as writer:
+        writer.add_polyline(path, colors, width)
+
+
+def write_hilbert(filename, hilbert, direction=90, size=(800, 800)):
+    """ Saves the curve hilbert.draw(direction) would draw. """
+    color_wheel = ColorWheel(hilbert.colorWheel.period)
+
+    with PathWriter(filename, size) as writer:
+        writer.add_points(
+            hilbert.iterate_points(direction),
+            lambda count: _get_run_colors(
+                color_wheel, count, hilbert.color_buckets),
+            hilbert.turtle.pensize())
+
+
+def write_poly_flake(
+        filename,
+        direction,
+        length,
+        side_count,
+        iterations,
+        start=(0, 0),
+        rainbow=0,
+        color=(0.0, 0.0, 1.0),
+        size=(800, 800)):
+    """ Saves the flake polyflake.draw_poly_flake would draw. """
+    import polyflake
+
+    if rainbow:
+        segment = polyflake.RecursivePolySegment(
+            None, side_count, iterations, rainbow)
+
+        colors = segment.color_wheel.colors_for
+    else:
+        colors = color
+
+    with PathWriter(filename, size) as writer:
+        writer.add_points(
+            polyflake.iterate_poly_flake_points(
+                direction, length, side_count, iterations, start),
+            colors)
+
+
+def write_scene(filename, scene, size=(800, 800), background=(0, 0, 0)):
+    """ Saves every curve added to a scene.Scene. """
+    from scene import Segments
+
+    strokes = scene.compute()
+
+    with PathWriter(filename, size, background) as writer:
+        for stroke in strokes:
+            if isinstance(stroke, Segments):
+                writer.add_segments(
+                    stroke.starts, stroke.ends, stroke.color, stroke.width)
+            else:
+                writer.add_polyline(stroke.points, stroke.color, stroke.width)
+
+
+def _get_run_colors(color_wheel, count, bucket_count):
+    runs = color_wheel.get_color_runs(count, bucket_count)
+    colors = np.array([color for start, stop, color in runs])
+    lengths = [stop - start for start, stop, color in runs]
+
+    return np.repeat(colors, lengths, axis=0)
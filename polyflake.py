@@ -1,9 +1,68 @@
 #!/usr/bin/env python
 
 
-import turtle
 import math
-from color_wheel import ColorWheel
+import numpy as np
+import geometry_cache
+import instrument
+import turtle_tools as tt
+from color_wheel import ColorWheel, get_hue_runs
+
+
+def get_turns(side_count):
+    exterior_angle = 360.0 / side_count
+    interior_angle = 180 - exterior_angle
+
+    return (0, -interior_angle) \
+        + (side_count - 2) * (exterior_angle,) \
+        + (-interior_angle,)
+
+
+def get_leaf_headings(side_count, depth, start, stop):
+    """
+    Returns the headings, relative to the initial direction, of leaves start
+    to stop of a segment subdivided depth times.
+
+    Each base (side_count + 1) digit of a leaf index selects the child taken
+    at one level, and the child's heading offset is the cumulative sum of
+    the turns before it, so a leaf's heading is the sum of one table lookup
+    per level.
+    """
+    offsets = np.cumsum(get_turns(side_count))
+    indices = np.arange(start, stop)
+    headings = np.zeros(len(indices))
+
+    for level in range(depth):
+        indices, digits = np.divmod(indices, side_count + 1)
+        headings += offsets[digits]
+
+    return headings
+
+
+def get_leaf_heading_table(side_count, depth):
+    return geometry_cache.cache.get_or_compute(
+        ('polyflake_headings', side_count, depth),
+        lambda: get_leaf_headings(
+            side_count, depth, 0, (side_count + 1) ** depth))
+
+
+def _compute_leaf_point_table(side_count, depth):
+    radians = np.radians(get_leaf_heading_table(side_count, depth))
+    points = np.zeros((len(radians) + 1, 2))
+    points[1:, 0] = np.cumsum(np.cos(radians))
+    points[1:, 1] = np.cumsum(np.sin(radians))
+
+    return points
+
+
+def get_leaf_point_table(side_count, depth):
+    """
+    Returns the vertices of a segment subdivided depth times, starting at
+    the origin, for direction 0 and a leaf length of 1.
+    """
+    return geometry_cache.cache.get_or_compute(
+        ('polyflake_points', side_count, depth),
+        lambda: _compute_leaf_point_table(side_count, depth))
 
 
 class RecursivePolySegment(object):
@@ -12,12 +71,7 @@ class RecursivePolySegment(object):
             raise ValueError('Side count less than 3 is nonsensical')
 
         self.turtle = turtle
-        exterior_angle = 360.0 / side_count
-        interior_angle = 180 - exterior_angle
-
-        self.turns = (0, -interior_angle) \
-            + (side_count - 2) * (exterior_angle,) \
-            + (-interior_angle,)
+        self.turns = get_turns(side_count)
 
         self.limit_count = limit_count
         self.side_count = side_count
@@ -58,6 +112,261 @@ class RecursivePolySegment(object):
     def get_predicted_segment_count(self):
         return self.side_count * (self.side_count + 1) ** (self.limit_count)
 
+    def get_leaf_depth(self):
+        # __call__ subdivides while count < limit_count, so a fractional
+        # limit_count rounds up.
+        return max(int(math.ceil(self.limit_count)), 0)
+
+    def iterate_headings(self, direction, chunk_size=65536):
+        """
+        Yields the heading of every leaf segment of __call__, in order, as
+        chunks of at most chunk_size. Each chunk is computed in closed form
+        from the leaf indices, so memory use depends only on chunk_size.
+        """
+        depth = self.get_leaf_depth()
+        leaf_count = (self.side_count + 1) ** depth
+
+        for start in range(0, leaf_count, chunk_size):
+            stop = min(start + chunk_size, leaf_count)
+
+            yield direction + get_leaf_headings(
+                self.side_count, depth, start, stop)
+
+    def get_points(self, direction, segment_length, start=(0, 0)):
+        """
+        Returns all vertices drawn by __call__ from start as one (N, 2)
+        array, transformed from the cached table for this side_count and
+        depth.
+        """
+        depth = self.get_leaf_depth()
+        scale = segment_length / 3.0 ** depth
+        radians = math.radians(direction)
+        cos, sin = math.cos(radians), math.sin(radians)
+        rotation = scale * np.array([[cos, sin], [-sin, cos]])
+
+        return np.asarray(start, dtype=np.float64) \
+            + get_leaf_point_table(self.side_count, depth) @ rotation
+
+    def iterate_points(
+            self,
+            direction,
+            segment_length,
+            start=(0, 0),
+            chunk_size=65536):
+        """
+        Yields the vertices drawn by __call__ from start, in (k, 2) chunks.
+        The first chunk begins with start itself.
+        """
+        leaf_length = segment_length / 3.0 ** self.get_leaf_depth()
+        position = np.array(start, dtype=np.float64).reshape(1, 2)
+        yield position
+
+        for headings in self.iterate_headings(direction, chunk_size):
+            radians = np.radians(headings)
+
+            steps = leaf_length * np.stack(
+                (np.cos(radians), np.sin(radians)),
+                axis=1)
+
+            points = position + np.cumsum(steps, axis=0)
+            position = points[-1:]
+            yield points
+
+    def draw(self, direction, segment_length, chunk_size=65536):
+        """ Draws the same segments as __call__ without recursion. """
+        leaf_length = segment_length / 3.0 ** self.get_leaf_depth()
+
+        for headings in self.iterate_headings(direction, chunk_size):
+            if self.rainbow:
+                colors = self.color_wheel.colors_for(len(headings)).tolist()
+
+                for heading, color in zip(headings.tolist(), colors):
+                    self.turtle.setheading(heading)
+                    self.turtle.color(tuple(color))
+                    self.turtle.forward(leaf_length)
+            else:
+                for heading in headings.tolist():
+                    self.turtle.setheading(heading)
+                    self.turtle.forward(leaf_length)
+
+            self.segment_count += len(headings)
+
+    def get_extent(self, segment_length):
+        # Every point of a subdivided segment lies within this distance of
+        # the straight segment it replaces.
+        return segment_length / (2 * math.sin(math.pi / self.side_count))
+
+    def iterate_visible_points(
+            self,
+            direction,
+            segment_length,
+            start=(0, 0),
+            viewport=None,
+            scale=1.0,
+            pixel_threshold=1.0,
+            chunk_size=65536,
+            with_positions=False):
+        """
+        Yields vertices like iterate_points, but stops subdividing a branch
+        once it is shorter than pixel_threshold pixels, or when it cannot
+        reach the viewport. Such a branch is drawn as one straight segment.
+
+        viewport is (left, bottom, right, top) in turtle coordinates, scale
+        is pixels per unit, and a limit_count of None subdivides until the
+        pixel threshold is reached. With with_positions, each chunk is a
+        (points, positions) pair, where positions run from 0 at start to 1
+        at the end in proportion to the leaves of the full segment.
+        """
+        if self.limit_count is None:
+            depth = math.inf
+        else:
+            depth = self.get_leaf_depth()
+
+        offsets = np.cumsum(self.turns).tolist()
+        points = [tuple(start)]
+        positions = [0.0]
+
+        # Each entry also holds the position it starts at and the share of
+        # the leaves it covers.
+        stack = [(start[0], start[1], direction, segment_length, 0, 0.0, 1.0)]
+
+        while stack:
+            x, y, direction, length, count, position, share = stack.pop()
+            radians = math.radians(direction)
+            end_x = x + length * math.cos(radians)
+            end_y = y + length * math.sin(radians)
+            extent = self.get_extent(length)
+
+            is_split = \
+                count < depth \
+                and length * scale >= pixel_threshold \
+                and tt.is_box_visible(
+                    min(x, end_x) - extent,
+                    min(y, end_y) - extent,
+                    max(x, end_x) + extent,
+                    max(y, end_y) + extent,
+                    viewport)
+
+            if not is_split:
+                points.append((end_x, end_y))
+                positions.append(position + share)
+
+                if len(points) >= chunk_size:
+                    yield self._get_chunk(points, positions, with_positions)
+                    points = []
+                    positions = []
+
+                continue
+
+            length /= 3.0
+            share /= len(offsets)
+            children = []
+
+            for i, offset in enumerate(offsets):
+                children.append((
+                    x,
+                    y,
+                    direction + offset,
+                    length,
+                    count + 1,
+                    position + i * share,
+                    share))
+
+                radians = math.radians(direction + offset)
+                x += length * math.cos(radians)
+                y += length * math.sin(radians)
+
+            # Reversed so that the first child is popped first.
+            children.reverse()
+            stack.extend(children)
+
+        if points:
+            yield self._get_chunk(points, positions, with_positions)
+
+    @staticmethod
+    def _get_chunk(points, positions, with_positions):
+        if with_positions:
+            return np.array(points), np.array(positions)
+
+        return np.array(points)
+
+
+def iterate_poly_flake_points(
+        direction,
+        length,
+        side_count,
+        iterations,
+        start=(0, 0),
+        chunk_size=65536):
+    """
+    Yields the vertices of a whole flake, as drawn by draw_poly_flake from
+    start, in (k, 2) chunks.
+    """
+    segment = RecursivePolySegment(None, side_count, iterations)
+    position = start
+
+    for i in range(side_count):
+        direction += (360.0 / side_count)
+        points = segment.iterate_points(
+            direction, length, position, chunk_size)
+
+        if i > 0:
+            # Skip the start, it repeats the end of the previous side.
+            next(points)
+
+        for chunk in points:
+            position = chunk[-1]
+            yield chunk
+
+
+def iterate_visible_poly_flake_points(
+        direction,
+        length,
+        side_count,
+        iterations=None,
+        start=(0, 0),
+        viewport=None,
+        scale=1.0,
+        pixel_threshold=1.0,
+        chunk_size=65536,
+        with_positions=False):
+    """
+    Yields the vertices of a whole flake with level of detail culling. See
+    RecursivePolySegment.iterate_visible_points. With with_positions, the
+    positions run from 0 to side_count, one unit per side.
+    """
+    segment = RecursivePolySegment(None, side_count, iterations)
+    position = start
+
+    for i in range(side_count):
+        direction += (360.0 / side_count)
+
+        points = segment.iterate_visible_points(
+            direction,
+            length,
+            position,
+            viewport,
+            scale,
+            pixel_threshold,
+            chunk_size,
+            with_positions=True)
+
+        for j, (chunk, positions) in enumerate(points):
+            if i > 0 and j == 0:
+                # Skip the start, it repeats the end of the previous side.
+                chunk = chunk[1:]
+                positions = positions[1:]
+
+                if len(chunk) == 0:
+                    continue
+
+            position = tuple(chunk[-1])
+
+            if with_positions:
+                yield chunk, i + positions
+            else:
+                yield chunk
+
 
 def draw_poly_flake(
         instance,
@@ -65,7 +374,25 @@ def draw_poly_flake(
         length,
         side_count,
         iterations=None,
-        rainbow=0):
+        rainbow=0,
+        viewport=None,
+        scale=1.0,
+        pixel_threshold=1.0):
+
+    if viewport is not None:
+        # iterations, when given, still caps the culled detail.
+        draw_visible_poly_flake(
+            instance,
+            direction,
+            length,
+            side_count,
+            viewport,
+            scale,
+            pixel_threshold,
+            iterations,
+            rainbow)
+
+        return
 
     if iterations is None:
         # calculate the max visible for size length
@@ -74,11 +401,87 @@ def draw_poly_flake(
     instance.getscreen().tracer(0)
     recursive = RecursivePolySegment(instance, side_count, iterations, rainbow)
 
-    for i in range(side_count):
-        direction += (360.0 / side_count)
-        recursive(direction, length, 0)
+    with instrument.phase('polyflake', 'draw', instance):
+        for i in range(side_count):
+            direction += (360.0 / side_count)
+            recursive.draw(direction, length)
 
+    instrument.count('polyflake', 'segments', recursive.segment_count)
     instance.getscreen().update()
+    instrument.count('polyflake', 'updates')
+
+
+def draw_visible_poly_flake(
+        instance,
+        direction,
+        length,
+        side_count,
+        viewport,
+        scale=1.0,
+        pixel_threshold=1.0,
+        iterations=None,
+        rainbow=0,
+        color_buckets=256):
+    """
+    Draws a flake with level of detail culling. With rainbow, each segment
+    takes the color draw_poly_flake gives the leaf it starts at, so a
+    culled branch takes the color of its first leaf, quantized to
+    color_buckets hues.
+    """
+    if rainbow:
+        # The same wheel as draw_poly_flake, which is sized from the
+        # predicted segment count and so wraps more often than rainbow times
+        # when iterations is fractional.
+        if iterations is None:
+            limit_count = RecursivePolySegment.get_pixel_based_limit_count(
+                length)
+        else:
+            limit_count = iterations
+
+        segment = RecursivePolySegment(None, side_count, limit_count, rainbow)
+        color_wheel = segment.color_wheel
+        leaves_per_side = (side_count + 1) ** segment.get_leaf_depth()
+
+    instance.getscreen().tracer(0)
+    last_point = None
+    last_position = None
+    segment_count = 0
+
+    with instrument.phase('polyflake', 'draw', instance):
+        for points, positions in iterate_visible_poly_flake_points(
+                direction,
+                length,
+                side_count,
+                iterations,
+                instance.pos(),
+                viewport,
+                scale,
+                pixel_threshold,
+                with_positions=True):
+
+            if last_point is not None:
+                points = np.concatenate((last_point, points))
+                positions = np.concatenate((last_position, positions))
+
+            if rainbow:
+                # The offset absorbs rounding in positions, which fall on
+                # leaf boundaries.
+                leaves = np.floor(
+                    positions[:-1] * leaves_per_side + 1e-6).astype(np.int64)
+                hues = leaves % color_wheel.period * color_wheel.angle_delta
+
+                for start, stop, color in get_hue_runs(hues, color_buckets):
+                    tt.draw_polyline(instance, points[start:stop + 1], color)
+            else:
+                tt.draw_polyline(instance, points)
+
+            segment_count += len(points) - 1
+            last_point = points[-1:]
+            last_position = positions[-1:]
+
+    instrument.count('polyflake', 'segments', segment_count)
+    instance.getscreen().update()
+    instrument.count('polyflake', 'updates')
 
 
 def draw_koch_snowflake():
@@ -101,8 +504,11 @@ def simple_draw_flake(side_count, limit, rainbow=0):
     draw_poly_flake(0, length, side_count, limit, rainbow)
 
 
-def demo(rainbow=0):
-    instance = turtle.Turtle()
+def demo(rainbow=0, instance=None):
+    if instance is None:
+        import turtle
+
+        instance = turtle.Turtle()
 
     for n in range(3, 5):
         length = 1500.0 / n
@@ -0,0 +1,184 @@
+"""
+Draws a stream of points a frame at a time, so that a long render leaves the
+window responsive and can be cancelled before it finishes.
+
+A stream yields (k, 2) arrays of points, or (points, color) pairs, that join
+into one polyline, like the generators' iterate_points methods. Each frame
+draws as many points as fit in frame_time seconds, updates the screen, and
+then hands control back to Tk or asyncio.
+"""
+
+import time
+
+import instrument
+import turtle_tools as tt
+
+
+class ProgressiveRenderer:
+    def __init__(
+            self,
+            pen,
+            chunks,
+            frame_time=1 / 60.0,
+            color=None,
+            on_done=None):
+
+        self.pen = pen
+        self.screen = pen.getscreen()
+        self.frame_time = frame_time
+        self.color = color
+        self.on_done = on_done
+        self.frame_count = 0
+        self.point_count = 0
+        self.cancelled = False
+        self.done = False
+
+        # Points drawn per call, adjusted to the measured drawing speed.
+        self.chunk_size = 256
+
+        self._chunks = iter(chunks)
+        self._pending = None
+        self._pending_color = None
+        self._last_point = None
+        self._tracer = None
+
+    def cancel(self):
+        """ Stops the render before its next piece. """
+        self.cancelled = True
+
+    def _next_piece(self):
+        import numpy as np
+
+        if self._pending is None or len(self._pending) == 0:
+            item = next(self._chunks)
+
+            if isinstance(item, tuple):
+                self._pending, self._pending_color = item
+            else:
+                self._pending, self._pending_color = item, self.color
+
+            self._pending = np.asarray(self._pending, dtype=np.float64)
+
+        piece = self._pending[:self.chunk_size]
+        self._pending = self._pending[self.chunk_size:]
+
+        return piece, self._pending_color
+
+    def draw_frame(self):
+        """
+        Draws pieces of the stream for up to frame_time seconds and updates
+        the screen. Returns whether there is more to draw.
+        """
+        import numpy as np
+
+        if self.done:
+            return False
+
+        if self._tracer is None:
+            # Drawing is flushed once per frame instead of by the tracer.
+            self._tracer = self.screen.tracer()
+            self.screen.tracer(0)
+
+        start = time.perf_counter()
+        deadline = start + self.frame_time
+
+        while not self.cancelled:
+            try:
+                points, color = self._next_piece()
+            except StopIteration:
+                self.finish()
+                return False
+
+            if self._last_point is not None:
+                points = np.concatenate((self._last_point, points))
+
+            if len(points) == 0:
+                continue
+
+            piece_start = time.perf_counter()
+            tt.draw_polyline(self.pen, points, color)
+            now = time.perf_counter()
+
+            self.point_count += len(points)
+            self._last_point = points[-1:]
+
+            # Aim for about four pieces per frame.
+            rate = len(points) / max(now - piece_start, 1e-6)
+
+            self.chunk_size = int(
+                min(max(rate * self.frame_time / 4, 16), 2 ** 20))
+
+            if now >= deadline:
+                break
+
+        self.frame_count += 1
+        self.screen.update()
+        instrument.count('progressive', 'updates')
+
+        if self.cancelled:
+            self.finish()
+            return False
+
+        return True
+
+    def finish(self):
+        if self.done:
+            return
+
+        self.done = True
+
+        if self._tracer is not None:
+            self.screen.tracer(self._tracer)
+
+        self.screen.update()
+
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def run(self):
+        """ Draws every frame now, updating the screen between them. """
+        while self.draw_frame():
+            pass
+
+        return self
+
+    def start(self, delay=0):
+        """
+        Draws one frame each time the Tk event loop is idle, using the
+        screen's ontimer. Returns immediately.
+        """
+        def step():
+            if self.draw_frame():
+                self.screen.ontimer(step, delay)
+
+        self.screen.ontimer(step, delay)
+
+        return self
+
+    async def run_async(self):
+        """
+        Draws one frame per pass of the asyncio event loop. Cancelling the
+        task also cancels the render.
+        """
+        import asyncio
+
+        try:
+            while self.draw_frame():
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancel()
+            self.finish()
+            raise
+
+        return self
+
+
+def iterate_chunks(points, chunk_size=65536, color=None):
+    """ Splits an (N, 2) array into stream chunks. """
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+
+        if color is None:
+            yield chunk
+        else:
+            yield chunk, color
@@ -0,0 +1,92 @@
+"""
+Adaptive sampling of curves by chord error.
+
+A fixed angular step has to be small enough for the most curved part of a
+curve, and so over-samples everything else. Here points are placed so that
+no chord strays more than tolerance pixels from the true curve, which for an
+arc of curvature k and chord length c is about k * c ** 2 / 8.
+"""
+
+import math
+
+import numpy as np
+
+
+class SamplingStats:
+    """ Counts adaptive points against the uniform points they replace. """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.uniform_points = 0
+        self.adaptive_points = 0
+
+    @property
+    def saved_points(self):
+        return self.uniform_points - self.adaptive_points
+
+    def record(self, uniform_points, adaptive_points):
+        """ Adds one sampled curve and returns the points it saved. """
+        self.uniform_points += uniform_points
+        self.adaptive_points += adaptive_points
+
+        return uniform_points - adaptive_points
+
+
+stats = SamplingStats()
+
+
+def get_circle_step_count(radius, tolerance=0.25, minimum=4):
+    """
+    Returns the number of equal steps around a circle of radius pixels
+    that keeps the chord error within tolerance pixels.
+    """
+    if radius <= 0:
+        return minimum
+
+    cosine = max(1.0 - tolerance / abs(radius), -1.0)
+    angle_delta = 2 * math.acos(cosine)
+
+    return max(int(math.ceil(2 * math.pi / angle_delta)), minimum)
+
+
+def get_adaptive_parameters(
+        parameters,
+        velocities,
+        accelerations,
+        tolerance=0.25,
+        max_length=16.0,
+        minimum=4):
+    """
+    Returns increasing parameter values, including both ends of parameters,
+    at which a curve can be sampled with a chord error of about tolerance
+    pixels and no chord longer than max_length pixels.
+
+    parameters is an increasing (N,) guide grid, dense enough to follow
+    changes in curvature, and velocities and accelerations are the (N, 2)
+    first and second derivatives of the curve, in pixels, at each of them.
+    """
+    velocities = np.asarray(velocities, dtype=np.float64)
+    accelerations = np.asarray(accelerations, dtype=np.float64)
+
+    speeds = np.hypot(velocities[:, 0], velocities[:, 1])
+
+    cross = np.abs(
+        velocities[:, 0] * accelerations[:, 1]
+        - velocities[:, 1] * accelerations[:, 0])
+
+    # Points needed per unit of parameter: speed / chord length, where the
+    # chord length for the local curvature is sqrt(8 * tolerance / k).
+    density = np.sqrt(cross / np.maximum(speeds, 1e-12) / (8.0 * tolerance))
+    density = np.maximum(density, speeds / max_length)
+
+    # Place points at equal steps of the integrated density.
+    cumulative = np.zeros(len(parameters))
+
+    cumulative[1:] = np.cumsum(
+        (density[1:] + density[:-1]) / 2.0 * np.diff(parameters))
+
+    count = max(int(math.ceil(cumulative[-1])), minimum)
+    targets = np.linspace(0.0, cumulative[-1], count + 1)
+
+    return np.interp(targets, cumulative, parameters)
@@ -0,0 +1,193 @@
+"""
+A scene collects curves from any of the generators and draws them together.
+
+Curves are added as functions that compute their strokes, so independent
+curves can be computed concurrently. flush then draws every stroke in one
+pass, grouped by pen width and color so that the pen state changes once per
+group, and updates the screen once.
+
+    scene = Scene(pen)
+    scene.add_trochoid(trochoid)
+    scene.add_circles(250, 120, 42)
+    scene.flush()
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrument
+import polyflake
+import turtle_tools as tt
+from color_wheel import ColorWheel
+from shapes import get_circle_array
+
+
+# points is an (N, 2) array drawn as one connected line.
+Polyline = namedtuple('Polyline', 'points color width')
+
+# starts and ends are (N, 2) arrays of unconnected segments.
+Segments = namedtuple('Segments', 'starts ends color width')
+
+
+class Scene:
+    def __init__(self, pen, workers=None):
+        self.pen = pen
+        self.screen = pen.getscreen()
+        self.workers = workers
+
+        # When sorted, strokes are drawn grouped by pen state rather than in
+        # the order they were added, so overlaps may stack differently.
+        self.sort = True
+
+        self._curves = []
+
+    def __len__(self):
+        return len(self._curves)
+
+    def add(self, compute):
+        """
+        Adds a curve. compute is called with no arguments, possibly in
+        another thread, and returns a list of Polyline and Segments.
+        """
+        self._curves.append(compute)
+
+    def add_polyline(self, points, color, width=1):
+        self.add(lambda: [Polyline(np.asarray(points), color, width)])
+
+    def add_segments(self, starts, ends, color, width=1):
+        self.add(lambda: [
+            Segments(np.asarray(starts), np.asarray(ends), color, width)])
+
+    def add_trochoid(self, trochoid, rainbow_count=1, width=1):
+        """ Adds the curve that trochoid.draw would draw, in color runs. """
+        def compute():
+            path = trochoid.compute_path()
+            color_wheel = ColorWheel(len(path) / rainbow_count)
+
+            return [
+                Polyline(path[start:stop + 1], color, width)
+                for start, stop, color in color_wheel.get_color_runs(
+                    len(path) - 1,
+                    trochoid.color_buckets)]
+
+        self.add(compute)
+
+    def add_circles(
+            self,
+            path_radius,
+            circle_radius,
+            steps,
+            path_center=(0, 0),
+            use_rainbow=False,
+            color=(1.0, 1.0, 1.0),
+            width=1,
+            sampling='uniform'):
+        """ Adds the circles Shapes.draw_circles_on_path would draw. """
+        def compute():
+            centers = get_circle_array(path_radius, steps) + path_center
+            circle = get_circle_array(circle_radius, sampling=sampling)
+            instances = centers[:, np.newaxis, :] + circle
+
+            if use_rainbow:
+                colors = ColorWheel(steps).colors_for(steps).tolist()
+                colors = [tuple(c) for c in colors]
+            else:
+                colors = [color] * steps
+
+            return [
+                Polyline(points, c, width)
+                for points, c in zip(instances, colors)]
+
+        self.add(compute)
+
+    def add_chords(self, line_set, targets, color=(1.0, 1.0, 1.0), width=1):
+        """
+        Adds the chords LineSetMixin.draw_chords would draw for targets,
+        like those from get_circle_targets or get_oid_targets.
+        """
+        def compute():
+            starts, ends = line_set.get_chord_segments(targets)
+            return [Segments(starts, ends, color, width)]
+
+        self.add(compute)
+
+    def add_flake(
+            self,
+            direction,
+            length,
+            side_count,
+            iterations=None,
+            start=(0, 0),
+            color=(1.0, 1.0, 1.0),
+            width=1):
+        """ Adds a flake like polyflake.draw_poly_flake, in one color. """
+        if iterations is None:
+            iterations = \
+                polyflake.RecursivePolySegment.get_pixel_based_limit_count(
+                    length)
+
+        def compute():
+            points = np.concatenate(list(polyflake.iterate_poly_flake_points(
+                direction, length, side_count, iterations, start)))
+
+            return [Polyline(points, color, width)]
+
+        self.add(compute)
+
+    def compute(self):
+        """ Computes every curve, concurrently, and returns the strokes. """
+        with instrument.phase('scene', 'geometry'):
+            if self.workers == 1 or len(self._curves) < 2:
+                results = [compute() for compute in self._curves]
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    results = list(executor.map(
+                        lambda compute: compute(), self._curves))
+
+        return [stroke for strokes in results for stroke in strokes]
+
+    def flush(self):
+        """
+        Draws every curve added since the last flush with a single screen
+        update, and empties the scene.
+        """
+        strokes = self.compute()
+        self._curves = []
+
+        if self.sort:
+            # Stable, so strokes of one style keep the order they were added.
+            strokes.sort(key=lambda stroke: (stroke.width, repr(stroke.color)))
+
+        tracer = self.screen.tracer()
+        self.screen.tracer(0)
+        is_down = self.pen.isdown()
+        self.pen.pendown()
+        state = None
+
+        with instrument.phase('scene', 'draw', self.pen):
+            for stroke in strokes:
+                if (stroke.width, stroke.color) != state:
+                    state = (stroke.width, stroke.color)
+                    self.pen.pensize(stroke.width)
+                    self.pen.pencolor(stroke.color)
+                    instrument.count('scene', 'state_changes')
+
+                if isinstance(stroke, Segments):
+                    tt.draw_segments(self.pen, stroke.starts, stroke.ends)
+                    segment_count = len(stroke.starts)
+                else:
+                    tt.draw_polyline(self.pen, stroke.points)
+                    segment_count = len(stroke.points) - 1
+
+                instrument.count('scene', 'segments', segment_count)
+
+        if not is_down:
+            self.pen.penup()
+
+        self.screen.update()
+        instrument.count('scene', 'updates')
+        self.screen.tracer(tracer)
+
+        return len(strokes)
@@ -2,39 +2,107 @@
 
 
 import turtle_tools as tt
-import turtle
 import math
+import numpy as np
+import geometry_cache
+import instrument
 from color_wheel import ColorWheel
+from sampling import get_circle_step_count, stats as sampling_stats
 
 
-def get_circle_points(radius, steps=None):
+def get_circle_points(
+        radius,
+        steps=None,
+        sampling='uniform',
+        tolerance=0.25):
+    """
+    Returns the points of a circle around the origin as a new (N, 2) array.
+    Rows add, subtract and scale like turtle.Vec2D.
+
+    sampling picks the step count when steps is not given: 'uniform' keeps
+    arcs of about 2 pixels, and 'adaptive' uses the fewest steps whose
+    chords stay within tolerance pixels of the circle.
+    """
+    return _compute_circle_array(radius, steps, sampling, tolerance)
+
+
+def _get_circle_steps(radius, steps, sampling, tolerance):
+    """ Returns the step count and angle step for get_circle_points. """
     if steps is None:
         # determine arc that will ensure smooth rendering for any sized circle
         angle_delta = tt.get_smooth_angle_delta(radius)
         steps = int(math.ceil(2 * math.pi / angle_delta))
+
+        if sampling == 'adaptive':
+            uniform_steps = steps
+            steps = min(get_circle_step_count(radius, tolerance), steps)
+            angle_delta = 2 * math.pi / steps
+            sampling_stats.record(uniform_steps, steps)
+        elif sampling != 'uniform':
+            raise ValueError(f'Unknown sampling mode: {sampling}')
     else:
         angle_delta = 2 * math.pi / steps
 
-    angles = [i * angle_delta for i in range(steps)]
+    return steps, angle_delta
+
+
+def _compute_circle_array(radius, steps, sampling, tolerance):
+    steps, angle_delta = _get_circle_steps(radius, steps, sampling, tolerance)
+    angles = np.arange(steps) * angle_delta
+
+    return radius * np.stack((np.cos(angles), np.sin(angles)), axis=1)
 
-    points = [
-        turtle.Vec2D(radius * math.cos(theta), radius * math.sin(theta))
-        for theta in angles]
 
-    return points
+def get_circle_array(radius, steps=None, sampling='uniform', tolerance=0.25):
+    """
+    Returns get_circle_points as a read-only (N, 2) array, computed once
+    per radius and step count and shared through the geometry cache.
+    """
+    key = ('circle', radius, steps, sampling, tolerance)
+
+    return geometry_cache.cache.get_or_compute(
+        key,
+        lambda: _compute_circle_array(radius, steps, sampling, tolerance))
 
 
 class Shapes:
-    def __init__(self, center=(0, 0)):
-        self.turtle = turtle.Turtle()
-        self.screen = self.turtle.getscreen()
+    def __init__(self, center=(0, 0), pen=None):
+        # pen may be any object with the turtle.Turtle drawing interface,
+        # for example a headless.HeadlessTurtle. Without one, a Tk turtle
+        # is created on first use.
+        self._turtle = None
         self.color_wheel = ColorWheel(256)
+
+        # When batched, each circle is drawn as one canvas line item.
+        self.batched = False
+
+        # Sampling mode passed to get_circle_points by draw_circle.
+        self.sampling = 'uniform'
+
+        if pen is not None:
+            self.turtle = pen
+
+    @property
+    def turtle(self):
+        if self._turtle is None:
+            import turtle
+            self.turtle = turtle.Turtle()
+
+        return self._turtle
+
+    @turtle.setter
+    def turtle(self, pen):
+        self._turtle = pen
         self.screen.bgcolor('black')
         self.turtle.shape('turtle')
         self.turtle.color('red')
         self.turtle.speed(10)
         self.screen.tracer(50)
 
+    @property
+    def screen(self):
+        return self.turtle.getscreen()
+
     def draw_square(self, size):
         for i in range(4):
             self.turtle.forward(size)
@@ -67,23 +135,37 @@ class Shapes:
             self.turtle.color(self.color_wheel.get_next_color())
 
     def draw_circle(self, radius, center=(0, 0), animate=True):
-        center = turtle.Vec2D(*center)
-        points = get_circle_points(radius)
+        with instrument.phase('shapes', 'geometry'):
+            points = get_circle_points(radius, sampling=self.sampling)
+            points += center
+
+        instrument.count('shapes', 'segments', len(points) - 1)
+
+        if self.batched:
+            with instrument.phase('shapes', 'draw', self.turtle):
+                self.turtle.penup()
+                self.turtle.setpos(*points[0])
+                self.turtle.pendown()
+                tt.draw_polyline(self.turtle, points)
+
+            return
+
         self.turtle.penup()
 
         try:
-            self.turtle.setpos(center + points[0])
+            self.turtle.setpos(*points[0])
         except IndexError:
             breakpoint()
 
         self.turtle.pendown()
 
         speed = self.turtle.speed()
-        last_p = points[0]
-        for idx, p in enumerate(points[1:]):
-            self.turtle.setheading(tt.get_heading(p, last_p))
-            self.turtle.setpos(p + center)
-            last_p = p
+        headings = tt.get_headings(points).tolist()
+
+        with instrument.phase('shapes', 'draw', self.turtle):
+            for p, heading in zip(points[1:].tolist(), headings[1:]):
+                self.turtle.setheading(heading)
+                self.turtle.setpos(*p)
 
     def draw_circles_on_path(
             self,
@@ -94,18 +176,49 @@ class Shapes:
             use_rainbow=False,
             animate=True):
 
-        points = get_circle_points(path_radius, steps)
-        center = turtle.Vec2D(*path_center)
+        if self.batched:
+            self.draw_circle_instances(
+                get_circle_array(path_radius, steps) + path_center,
+                circle_radius,
+                use_rainbow)
+            return
+
+        centers = get_circle_points(path_radius, steps) + path_center
+        centers = centers.tolist()
 
         if use_rainbow:
             self.color_wheel.set_period(steps)
 
-            for p in points:
+            for center in centers:
                 self.turtle.color(self.color_wheel.get_next_color())
-                self.draw_circle(circle_radius, p + center, animate)
+                self.draw_circle(circle_radius, center, animate)
         else:
-            for p in points:
-                self.draw_circle(circle_radius, p + center, animate)
+            for center in centers:
+                self.draw_circle(circle_radius, center, animate)
+
+    def draw_circle_instances(self, centers, radius, use_rainbow=False):
+        """
+        Stamps the same circle at every (x, y) in centers, one polyline per
+        circle, from a single broadcast of the shared circle points.
+        """
+        with instrument.phase('shapes', 'geometry'):
+            centers = np.asarray(centers, dtype=np.float64)
+            circle = get_circle_array(radius, sampling=self.sampling)
+            instances = centers[:, np.newaxis, :] + circle
+
+        with instrument.phase('shapes', 'color'):
+            if use_rainbow:
+                self.color_wheel.set_period(len(centers))
+                colors = self.color_wheel.colors_for(len(centers)).tolist()
+            else:
+                colors = [None] * len(centers)
+
+        instrument.count(
+            'shapes', 'segments', len(centers) * (len(circle) - 1))
+
+        with instrument.phase('shapes', 'draw', self.turtle):
+            for points, color in zip(instances, colors):
+                tt.draw_polyline(self.turtle, points, color)
 
 
 if __name__ == '__main__':
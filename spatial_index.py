@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+"""
+A uniform grid index over recorded segments, for hit testing and for
+redrawing only the part of an image that changed.
+
+Each grid cell lists the segments whose stroke, widened by half the pen
+width, overlaps it. The lists are stored end to end in one array with an
+offset per cell, so a query gathers a few slices instead of visiting every
+segment:
+
+    index = SegmentIndex(*screen.segments.arrays())
+    index.query_rect(-10, -10, 10, 10)
+    index.nearest(120, 35)
+
+Segments come in the (starts, ends, colors, widths) form of export, in
+turtle coordinates. from_chunks builds an index from a stream of them, like
+PathFile.iterate_segments.
+"""
+
+import math
+
+import numpy as np
+
+import export
+import instrument
+from tiles import get_box_cells
+
+
+class SegmentIndex:
+    def __init__(self, starts, ends, colors, widths, cell_size=None):
+        self.starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        self.ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        self.colors = np.array(colors, dtype=np.float32).reshape(-1, 3)
+        self.widths = np.asarray(widths, dtype=np.float32).reshape(-1)
+
+        # Hidden segments stay in the grid but are skipped by every query.
+        self.visible = np.ones(len(self.starts), dtype=bool)
+
+        # Matches the pen export.draw_segments stamps along each segment.
+        self._margins = np.maximum(self.widths, 1.0) / 2.0
+
+        with instrument.phase('spatial_index', 'build'):
+            self._build(cell_size)
+
+    @classmethod
+    def from_chunks(cls, chunks, cell_size=None):
+        """ Indexes a stream of (starts, ends, colors, widths) chunks. """
+        parts = list(zip(*chunks))
+
+        if not parts:
+            return cls(
+                np.zeros((0, 2)),
+                np.zeros((0, 2)),
+                np.zeros((0, 3)),
+                np.zeros(0),
+                cell_size)
+
+        return cls(*(np.concatenate(part) for part in parts), cell_size)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _get_boxes(self, indices=slice(None)):
+        """ Returns the widened bounding boxes as (N, 2) lows and highs. """
+        margins = self._margins[indices, np.newaxis]
+        starts = self.starts[indices]
+        ends = self.ends[indices]
+
+        return (
+            np.minimum(starts, ends) - margins,
+            np.maximum(starts, ends) + margins)
+
+    def _build(self, cell_size):
+        lows, highs = self._get_boxes()
+
+        if len(self) == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = cell_size or 1.0
+            self.shape = (1, 1)
+            self.offsets = np.zeros(2, dtype=np.intp)
+            self.cell_segments = np.zeros(0, dtype=np.intp)
+            return
+
+        self.origin = lows.min(axis=0)
+        extent = np.maximum(highs.max(axis=0) - self.origin, 1e-9)
+
+        if cell_size is None:
+            # About four segments per cell for evenly spread segments.
+            cell_size = math.sqrt(extent[0] * extent[1] * 4.0 / len(self))
+            cell_size = max(cell_size, float(extent.max()) / 4096.0, 1e-9)
+
+        self.cell_size = cell_size
+        columns, rows = np.maximum(np.ceil(extent / cell_size), 1)
+        self.shape = (int(rows), int(columns))
+
+        owner, cell_columns, cell_rows = get_box_cells(
+            *self._get_cell_ranges(lows, highs))
+
+        cell_ids = cell_rows * self.shape[1] + cell_columns
+
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_segments = owner[order]
+
+        self.offsets = np.zeros(self.shape[0] * self.shape[1] + 1, np.intp)
+        np.cumsum(
+            np.bincount(cell_ids, minlength=len(self.offsets) - 1),
+            out=self.offsets[1:])
+
+        instrument.count('spatial_index', 'cells', len(self.offsets) - 1)
+        instrument.count('spatial_index', 'entries', len(owner))
+
+    def _get_grid_corner(self):
+        """ Returns the (right, top) corner of the grid. """
+        return self.origin + self.cell_size * np.array(self.shape[::-1])
+
+    def _get_cell_ranges(self, lows, highs):
+        """ Returns the first and last (column, row) cells of each box. """
+        limit = (self.shape[1] - 1, self.shape[0] - 1)
+        low = np.floor((lows - self.origin) / self.cell_size)
+        high = np.floor((highs - self.origin) / self.cell_size)
+
+        return (
+            np.clip(low, 0, limit).astype(np.intp),
+            np.clip(high, 0, limit).astype(np.intp))
+
+    def _get_candidates(self, left, bottom, right, top):
+        """ Returns the visible segments listed in cells the rect touches. """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        grid_right, grid_top = self._get_grid_corner()
+
+        if right < self.origin[0] or left > grid_right \
+                or top < self.origin[1] or bottom > grid_top:
+            return np.zeros(0, dtype=np.intp)
+
+        low, high = self._get_cell_ranges(
+            np.array([[left, bottom]]),
+            np.array([[right, top]]))
+
+        columns = np.arange(low[0, 0], high[0, 0] + 1)
+        rows = np.arange(low[0, 1], high[0, 1] + 1)
+        cell_ids = (rows[:, np.newaxis] * self.shape[1] + columns).ravel()
+
+        firsts = self.offsets[cell_ids]
+        counts = self.offsets[cell_ids + 1] - firsts
+        owner = np.repeat(np.arange(len(cell_ids)), counts)
+
+        # Position of each entry in cell_segments, cell by cell.
+        gathered = np.cumsum(counts) - counts
+        positions = firsts[owner] + np.arange(len(owner)) - gathered[owner]
+
+        candidates = np.unique(self.cell_segments[positions])
+
+        return candidates[self.visible[candidates]]
+
+    def query_rect(self, left, bottom, right, top):
+        """
+        Returns the indices, in drawing order, of the visible segments whose
+        stroke overlaps the rect (left, bottom, right, top). A segment that
+        ends within half a pen width of a corner may be included too.
+        """
+        candidates = self._get_candidates(left, bottom, right, top)
+
+        lows, highs = self._get_boxes(candidates)
+
+        overlaps = \
+            (lows[:, 0] <= right) & (highs[:, 0] >= left) \
+            & (lows[:, 1] <= top) & (highs[:, 1] >= bottom)
+
+        candidates = candidates[overlaps]
+
+        # A box can overlap the rect while the segment passes a corner.
+        # Such a segment has every rect corner on the same side of it.
+        starts = self.starts[candidates]
+        deltas = self.ends[candidates] - starts
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        normals = np.stack((deltas[:, 1], -deltas[:, 0]), axis=1)
+        normals /= np.maximum(lengths, 1e-12)[:, np.newaxis]
+
+        corners = np.array(
+            [[left, bottom], [left, top], [right, bottom], [right, top]])
+
+        distances = np.einsum(
+            'nk,nck->nc',
+            normals,
+            corners[np.newaxis] - starts[:, np.newaxis])
+
+        margins = self._margins[candidates, np.newaxis]
+
+        separated = \
+            np.all(distances > margins, axis=1) \
+            | np.all(distances < -margins, axis=1)
+
+        return candidates[~separated | (lengths == 0)]
+
+    def get_distances(self, indices, x, y):
+        """ Returns the distance from (x, y) to each segment's centerline. """
+        starts = self.starts[indices]
+        deltas = self.ends[indices] - starts
+        offsets = np.array([x, y]) - starts
+
+        squared_lengths = np.einsum('nk,nk->n', deltas, deltas)
+        t = np.einsum('nk,nk->n', offsets, deltas)
+        t = np.clip(t / np.maximum(squared_lengths, 1e-24), 0.0, 1.0)
+
+        closest = offsets - deltas * t[:, np.newaxis]
+
+        return np.hypot(closest[:, 0], closest[:, 1])
+
+    def nearest(self, x, y, max_distance=None):
+        """
+        Returns (index, distance) of the visible segment closest to (x, y),
+        or None if there is none within max_distance. Later segments win
+        ties, since they are drawn on top.
+        """
+        point = np.array([x, y], dtype=np.float64)
+
+        # Start from the nearest edge of the grid when (x, y) is outside it.
+        outside = np.maximum(
+            np.maximum(self.origin - point, point - self._get_grid_corner()),
+            0.0)
+
+        radius = max(self.cell_size, float(np.hypot(*outside)))
+
+        # The farthest corner of the grid from (x, y) bounds the search.
+        reach = float(np.hypot(*np.maximum(
+            np.abs(point - self.origin),
+            np.abs(point - self._get_grid_corner()))))
+
+        if max_distance is not None:
+            reach = min(reach, max_distance)
+
+        while True:
+            radius = min(radius, reach)
+
+            candidates = self._get_candidates(
+                x - radius, y - radius, x + radius, y + radius)
+
+            if len(candidates):
+                distances = self.get_distances(candidates, x, y)
+                closest = len(distances) - 1 - np.argmin(distances[::-1])
+
+                # Anything nearer than radius is in one of the cells
+                # searched, so this is the nearest segment overall.
+                if distances[closest] <= radius:
+                    return int(candidates[closest]), float(distances[closest])
+
+            if radius >= reach:
+                return None
+
+            radius *= 2
+
+    def get_stroke_bounds(self, indices):
+        """ Returns (left, bottom, right, top) around the strokes. """
+        lows, highs = self._get_boxes(indices)
+
+        if len(lows) == 0:
+            return None
+
+        left, bottom = lows.min(axis=0)
+        right, top = highs.max(axis=0)
+
+        return float(left), float(bottom), float(right), float(top)
+
+    def get_dirty_tiles(self, indices, size, tile_size):
+        """
+        Returns the set of (row, column) tiles of a size = (width, height)
+        image, as tiles.render_tiled lays them out, that the strokes of the
+        segments touch.
+        """
+        width, height = size
+        limit = (-(-width // tile_size) - 1, -(-height // tile_size) - 1)
+
+        lows, highs = self._get_boxes(indices)
+
+        # Canvas pixels, with y pointing down, and a pixel for rounding.
+        left_top = np.stack(
+            (lows[:, 0] + width / 2.0, height / 2.0 - highs[:, 1]), axis=1)
+
+        right_bottom = np.stack(
+            (highs[:, 0] + width / 2.0, height / 2.0 - lows[:, 1]), axis=1)
+
+        low = np.floor((left_top - 1.0) / tile_size)
+        high = np.floor((right_bottom + 1.0) / tile_size)
+        on_image = np.all((high >= 0) & (low <= limit), axis=1)
+
+        low = np.clip(low[on_image], 0, limit).astype(np.intp)
+        high = np.clip(high[on_image], 0, limit).astype(np.intp)
+        _, columns, rows = get_box_cells(low, high)
+
+        return set(zip(rows.tolist(), columns.tolist()))
+
+    def set_colors(self, indices, colors):
+        """ Recolors segments and returns indices for get_dirty_tiles. """
+        self.colors[indices] = colors
+
+        return indices
+
+    def set_visible(self, indices, visible=True):
+        """ Hides or shows segments and returns their indices. """
+        self.visible[indices] = visible
+
+        return indices
+
+    def redraw_tile(
+            self,
+            image,
+            row,
+            column,
+            tile_size,
+            background=(0.0, 0.0, 0.0)):
+        """
+        Clears one tile of a (height, width, 3) image, drawn centered like
+        export.rasterize, and draws the visible segments that touch it.
+        """
+        height, width = image.shape[:2]
+        top = row * tile_size
+        left = column * tile_size
+        window = image[top:top + tile_size, left:left + tile_size]
+        window[:, :] = np.rint(np.asarray(background) * 255).astype(np.uint8)
+
+        # The tile in turtle coordinates, with a pixel for rounding.
+        indices = self.query_rect(
+            left - width / 2.0 - 1.0,
+            height / 2.0 - top - window.shape[0] - 1.0,
+            left + window.shape[1] - width / 2.0 + 1.0,
+            height / 2.0 - top + 1.0)
+
+        instrument.count('spatial_index', 'redrawn_segments', len(indices))
+
+        if len(indices) == 0:
+            return image
+
+        export.draw_segments(
+            window,
+            self.starts[indices],
+            self.ends[indices],
+            self.colors[indices],
+            self.widths[indices],
+            origin=(width / 2.0 - left, height / 2.0 - top))
+
+        return image
+
+    def redraw(self, image, indices, tile_size=64, background=(0.0, 0.0, 0.0)):
+        """
+        Redraws the tiles of image that the segments touch, after they were
+        recolored or hidden. Returns the tiles redrawn.
+        """
+        height, width = image.shape[:2]
+        tiles = self.get_dirty_tiles(indices, (width, height), tile_size)
+
+        with instrument.phase('spatial_index', 'redraw'):
+            for row, column in sorted(tiles):
+                self.redraw_tile(image, row, column, tile_size, background)
+
+        return tiles
+
+
+if __name__ == '__main__':
+    import time
+
+    from headless import HeadlessScreen, HeadlessTurtle
+    from trochoid import Trochoid
+
+    screen = HeadlessScreen(800, 800)
+    trochoid = Trochoid(pen=HeadlessTurtle(screen))
+    trochoid.batched = True
+    trochoid.set_radii(200, 70, 1.2)
+    trochoid.draw()
+
+    start = time.perf_counter()
+    index = SegmentIndex(*screen.segments.arrays())
+    print(f'indexed {len(index)} segments in '
+          f'{time.perf_counter() - start:.3f} s')
+
+    hit = index.nearest(100, 100)
+    start = time.perf_counter()
+
+    for _ in range(1000):
+        index.nearest(100, 100)
+
+    print(f'nearest to (100, 100): {hit} in '
+          f'{(time.perf_counter() - start) * 1e3:.0f} us')
+
+    image = export.rasterize(
+        index.starts, index.ends, index.colors, index.widths,
+        (800, 800), (0.0, 0.0, 0.0))
+
+    # Recolor the segments in one corner and redraw only their tiles.
+    selected = index.query_rect(0, 0, 200, 200)
+    tiles = index.redraw(image, index.set_colors(selected, (1.0, 1.0, 1.0)))
+    print(f'redrew {len(tiles)} tiles for {len(selected)} segments')
+
+    export.write_png('spatial_index.png', image)
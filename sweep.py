@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+Renders every combination of a parameter grid for one generator, one image
+per variant, in a pool of worker processes using the headless backend.
+
+    ./sweep.py trochoid -p arm=200,180 -p pen=70,65,50 -o gallery
+"""
+
+import argparse
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from headless import HeadlessScreen, HeadlessTurtle
+
+
+def render_trochoid(
+        screen,
+        arm=200,
+        pen=70,
+        epitrochoid=False,
+        rainbow_count=1,
+        pensize=2,
+        sampling='uniform'):
+
+    from trochoid import Trochoid
+
+    trochoid = Trochoid(pen=HeadlessTurtle(screen))
+    trochoid.batched = True
+    trochoid.turtle.pensize(pensize)
+    trochoid.is_epitrochoid = epitrochoid
+    trochoid.sampling = sampling
+
+    radius = min(screen.window_width(), screen.window_height()) * 0.9 / 2.0
+    trochoid.set_radii(arm, pen, radius / (arm + 2 * pen))
+    trochoid.draw(rainbow_count)
+
+
+def render_polyflake(screen, side_count=3, limit=3, rainbow=1):
+    import polyflake
+
+    # Size the base polygon to the screen and center it.
+    length = 0.6 * min(screen.window_width(), screen.window_height())
+    length *= math.sin(math.pi / side_count)
+
+    corners = np.concatenate(list(
+        polyflake.iterate_poly_flake_points(0, length, side_count, 0)))
+
+    instance = HeadlessTurtle(screen)
+    instance.hideturtle()
+    instance.color('blue')
+    instance.penup()
+    instance.setpos(*-corners[:-1].mean(axis=0))
+    instance.pendown()
+
+    polyflake.draw_poly_flake(instance, 0, length, side_count, limit, rainbow)
+
+
+def render_linesets(screen, point_count=180, skip=2, style='oid'):
+    from linesets import HeadlessLineTurtle
+
+    line_turtle = HeadlessLineTurtle(screen)
+    line_turtle.batched = True
+    line_turtle.color('white')
+
+    line_turtle.set_radius(
+        0.45 * min(screen.window_width(), screen.window_height()))
+
+    line_turtle.set_point_count(point_count)
+
+    if style == 'oid':
+        line_turtle.draw_oid(skip)
+    else:
+        line_turtle.draw_circle(skip)
+
+
+def render_hilbert(screen, depth=5):
+    from hilbert import HilbertCurve
+
+    edge_length = 0.9 * min(screen.window_width(), screen.window_height())
+
+    pen = HeadlessTurtle(screen)
+    pen.penup()
+    pen.setpos(-edge_length / 2.0, -edge_length / 2.0)
+    pen.pendown()
+
+    hilbert = HilbertCurve(pen, edge_length, depth)
+    hilbert.batched = True
+    hilbert.draw(90)
+
+
+def render_shapes(screen, count=42, squares=True, rainbow=True, pensize=2):
+    from shapes import Shapes
+
+    shapes = Shapes(pen=HeadlessTurtle(screen))
+    shapes.batched = True
+    shapes.turtle.hideturtle()
+    shapes.turtle.pensize(pensize)
+
+    radius = 0.45 * min(screen.window_width(), screen.window_height())
+    path_radius = 0.8 * radius
+    circle_radius = radius - path_radius
+
+    if squares:
+        square_size = math.sqrt(
+            0.5 * ((path_radius - circle_radius) * 0.95) ** 2)
+
+        shapes.draw_partial_squares(
+            square_size, count, (False, True, True, False))
+
+    shapes.draw_circles_on_path(
+        path_radius,
+        circle_radius,
+        count,
+        use_rainbow=rainbow)
+
+
+def render_complex_turtle(screen, circles=10, unit=0.1):
+    from color_wheel import ColorWheel
+    from complex_turtle import HeadlessComplexTurtle
+
+    # unit is the length of 1 + 0j as a fraction of the screen.
+    complex_turtle = HeadlessComplexTurtle(
+        unit * min(screen.window_width(), screen.window_height()), screen)
+
+    complex_turtle.batched = True
+    complex_turtle.hideturtle()
+    colors = ColorWheel(circles)
+
+    for i in range(circles):
+        complex_turtle.color(colors.get_next_color())
+        complex_turtle.draw_circle(2 ** (i + 2))
+
+
+GENERATORS = {
+    'trochoid': render_trochoid,
+    'polyflake': render_polyflake,
+    'linesets': render_linesets,
+    'hilbert': render_hilbert,
+    'shapes': render_shapes,
+    'complex_turtle': render_complex_turtle,
+}
+
+
+def iterate_variants(grid):
+    """ Yields a parameter dict for every combination in grid. """
+    names = list(grid)
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def get_variant_filename(generator, params, extension='png'):
+    parts = [generator] + [f'{name}={value}' for name, value in params.items()]
+
+    return '-'.join(parts) + '.' + extension
+
+
+def render_variant(generator, params, filename, size=(800, 800)):
+    """ Renders one variant to filename and returns its timings. """
+    screen = HeadlessScreen(*size)
+    screen.bgcolor('black')
+
+    start = time.perf_counter()
+    GENERATORS[generator](screen, **params)
+    drawn = time.perf_counter()
+    screen.save(filename)
+    saved = time.perf_counter()
+
+    return {
+        'generator': generator,
+        'params': params,
+        'filename': filename,
+        'segments': len(screen.segments),
+        'draw_seconds': drawn - start,
+        'save_seconds': saved - drawn,
+    }
+
+
+def sweep(
+        generator,
+        grid,
+        output_directory='.',
+        size=(800, 800),
+        extension='png',
+        workers=None):
+    """
+    Renders every variant of grid in a process pool and yields the timing
+    report of each as it completes.
+    """
+    if generator not in GENERATORS:
+        raise ValueError(f'Unknown generator: {generator}')
+
+    os.makedirs(output_directory, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                render_variant,
+                generator,
+                params,
+                os.path.join(
+                    output_directory,
+                    get_variant_filename(generator, params, extension)),
+                size)
+            for params in iterate_variants(grid)]
+
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def parse_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+
+    if text.lower() in ('true', 'false'):
+        return text.lower() == 'true'
+
+    return text
+
+
+def parse_parameter(text):
+    name, values = text.split('=', 1)
+
+    return name, [parse_value(value) for value in values.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('generator', choices=sorted(GENERATORS))
+
+    parser.add_argument(
+        '-p',
+        '--param',
+        action='append',
+        default=[],
+        type=parse_parameter,
+        help='name=value1,value2,... (repeat for each parameter)')
+
+    parser.add_argument('-o', '--output', default='.')
+    parser.add_argument('-s', '--size', type=int, default=800)
+    parser.add_argument('-f', '--format', default='png')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = 0
+
+    for report in sweep(
+            args.generator,
+            dict(args.param),
+            args.output,
+            (args.size, args.size),
+            args.format,
+            args.workers):
+
+        count += 1
+
+        print(
+            f"{report['filename']}: {report['segments']} segments, "
+            f"draw {report['draw_seconds']:.3f} s, "
+            f"save {report['save_seconds']:.3f} s")
+
+    print(f'{count} variants in {time.perf_counter() - start:.3f} s')
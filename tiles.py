@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+A tiled rasterizer for images too large to hold in memory.
+
+Segments are bucketed by the tiles they touch and spilled to one file per
+tile. Each tile is then rendered on its own, optionally in worker processes,
+straight into a memory mapped image, so peak memory depends on the tile size
+and the input chunk size rather than the final resolution.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import export
+
+
+# Endpoints and widths are kept at full precision, so that pixels round
+# the same way they do in export.rasterize.
+SEGMENT_RECORD = np.dtype([
+    ('x0', np.float64),
+    ('y0', np.float64),
+    ('x1', np.float64),
+    ('y1', np.float64),
+    ('color', np.uint8, 3),
+    ('width', np.float64),
+])
+
+
+def get_box_cells(low, high):
+    """
+    Enumerates the grid cells of boxes. low and high are (N, 2) integer
+    arrays of each box's first and last (column, row), and a box with a
+    last cell before its first has none.
+
+    Returns (owner, columns, rows): the box, column and row of every cell
+    of every box, box by box.
+    """
+    spans = np.maximum(high - low + 1, 0)
+    counts = spans[:, 0] * spans[:, 1]
+    owner = np.repeat(np.arange(len(low)), counts)
+
+    first = np.cumsum(counts) - counts
+    offset = np.arange(len(owner)) - first[owner]
+    columns = low[owner, 0] + offset % spans[owner, 0]
+    rows = low[owner, 1] + offset // spans[owner, 0]
+
+    return owner, columns, rows
+
+
+def get_tile_filename(directory, row, column):
+    return os.path.join(directory, f'tile-{row}-{column}.bin')
+
+
+def bucket_segments(
+        chunks,
+        size,
+        tile_size,
+        directory,
+        scale=1.0):
+    """
+    Appends every segment of chunks, a stream of (starts, ends, colors,
+    widths) in turtle coordinates, to the spill file of each tile its
+    bounding box touches. Returns the set of (row, column) tiles written.
+    """
+    width, height = size
+    columns = -(-width // tile_size)
+    rows = -(-height // tile_size)
+    center = np.array([width / 2.0, height / 2.0])
+    flip = np.array([1.0, -1.0])
+    touched = set()
+
+    for starts, ends, colors, widths in chunks:
+        # Canvas pixels, with y pointing down
+        p0 = np.asarray(starts, dtype=np.float64) * scale * flip + center
+        p1 = np.asarray(ends, dtype=np.float64) * scale * flip + center
+        pen_widths = np.asarray(widths, dtype=np.float64) * scale
+        margin = (pen_widths / 2.0 + 1.0)[:, np.newaxis]
+
+        low = np.floor((np.minimum(p0, p1) - margin) / tile_size)
+        high = np.floor((np.maximum(p0, p1) + margin) / tile_size)
+        low = np.maximum(low, 0).astype(np.intp)
+        high = np.minimum(high, (columns - 1, rows - 1)).astype(np.intp)
+
+        # Every tile in each segment's bounding box
+        owner, tile_columns, tile_rows = get_box_cells(low, high)
+
+        if len(owner) == 0:
+            continue
+
+        records = np.empty(len(owner), dtype=SEGMENT_RECORD)
+        records['x0'] = p0[owner, 0]
+        records['y0'] = p0[owner, 1]
+        records['x1'] = p1[owner, 0]
+        records['y1'] = p1[owner, 1]
+
+        records['color'] = np.rint(
+            np.asarray(colors)[owner] * 255).astype(np.uint8)
+
+        records['width'] = pen_widths[owner]
+
+        tile_ids = tile_rows * columns + tile_columns
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids = tile_ids[order]
+        records = records[order]
+        breaks = np.flatnonzero(np.diff(tile_ids)) + 1
+
+        for group in np.split(np.arange(len(records)), breaks):
+            row, column = divmod(int(tile_ids[group[0]]), columns)
+            touched.add((row, column))
+
+            with open(get_tile_filename(directory, row, column), 'ab') as f:
+                f.write(records[group].tobytes())
+
+    return touched
+
+
+def render_tile(image_filename, spill_filename, row, column, tile_size):
+    """ Draws one tile's spilled segments into the memory mapped image. """
+    image = np.load(image_filename, mmap_mode='r+')
+    top = row * tile_size
+    left = column * tile_size
+    window = image[top:top + tile_size, left:left + tile_size]
+    tile = np.array(window)
+
+    records = np.fromfile(spill_filename, dtype=SEGMENT_RECORD)
+
+    # draw_segments expects y up, so flip the canvas rows back and place
+    # the origin at the tile's corner.
+    starts = np.stack((records['x0'], -records['y0']), axis=1)
+    ends = np.stack((records['x1'], -records['y1']), axis=1)
+
+    export.draw_segments(
+        tile,
+        starts,
+        ends,
+        records['color'] / 255.0,
+        records['width'],
+        origin=(-left, -top))
+
+    window[...] = tile
+    image.flush()
+
+
+def render_tiled(
+        chunks,
+        size,
+        filename,
+        tile_size=1024,
+        background=(0.0, 0.0, 0.0),
+        scale=1.0,
+        workers=None,
+        temporary_directory=None):
+    """
+    Rasterizes a stream of (starts, ends, colors, widths) chunks into a
+    size = (width, height) image and writes it to filename.
+
+    A .npy filename keeps the memory mapped image itself. Any other
+    filename is written as PNG, one row at a time. workers is the number of
+    processes that render tiles; 1 renders them in this process.
+    """
+    width, height = size
+    directory = tempfile.mkdtemp(dir=temporary_directory)
+
+    try:
+        if filename.endswith('.npy'):
+            image_filename = filename
+        else:
+            image_filename = os.path.join(directory, 'image.npy')
+
+        image = np.lib.format.open_memmap(
+            image_filename,
+            mode='w+',
+            dtype=np.uint8,
+            shape=(height, width, 3))
+
+        background = np.rint(np.asarray(background) * 255).astype(np.uint8)
+
+        for top in range(0, height, tile_size):
+            image[top:top + tile_size] = background
+
+        image.flush()
+        del image
+
+        touched = bucket_segments(chunks, size, tile_size, directory, scale)
+
+        jobs = [
+            (image_filename,
+             get_tile_filename(directory, row, column),
+             row,
+             column,
+             tile_size)
+            for row, column in sorted(touched)]
+
+        if workers == 1:
+            for job in jobs:
+                render_tile(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(render_tile, *job)
+                               for job in jobs]:
+                    future.result()
+
+        if image_filename != filename:
+            export.write_png(filename, np.load(image_filename, mmap_mode='r'))
+    finally:
+        shutil.rmtree(directory)
+
+    return filename
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from hilbert import HilbertCurve
+    from headless import HeadlessTurtle, HeadlessScreen
+
+    parser = argparse.ArgumentParser(
+        description='Render a Hilbert curve poster with the tiled rasterizer')
+
+    parser.add_argument('filename')
+    parser.add_argument('-d', '--depth', type=int, default=9)
+    parser.add_argument('-s', '--size', type=int, default=20000)
+    parser.add_argument('-t', '--tile-size', type=int, default=2048)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    edge_length = 0.95 * args.size
+
+    pen = HeadlessTurtle(HeadlessScreen(args.size, args.size))
+    pen.penup()
+    pen.setpos(-edge_length / 2.0, -edge_length / 2.0)
+    hilbert = HilbertCurve(pen, edge_length, args.depth)
+
+    start = time.perf_counter()
+
+    render_tiled(
+        export.iterate_polyline_segments(
+            hilbert.iterate_points(90),
+            color=(1.0, 1.0, 1.0),
+            width=2),
+        (args.size, args.size),
+        args.filename,
+        args.tile_size,
+        workers=args.workers)
+
+    print(f'{args.filename} in {time.perf_counter() - start:.3f} s')
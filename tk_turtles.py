@@ -0,0 +1,21 @@
+"""
+The drawing mixins on top of turtle.Turtle.
+
+These classes live apart from linesets and complex_turtle, which hold the
+mixins and their headless versions, so that those modules can be imported
+without loading turtle and tkinter. linesets.LineTurtle and
+complex_turtle.ComplexTurtle still resolve to the classes here.
+"""
+
+import turtle
+
+from complex_turtle import ComplexTurtleMixin
+from linesets import LineSetMixin
+
+
+class LineTurtle(LineSetMixin, turtle.Turtle):
+    pass
+
+
+class ComplexTurtle(ComplexTurtleMixin, turtle.Turtle):
+    pass
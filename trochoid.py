@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 
 import turtle_tools as tt
-import turtle
 import math
+import numpy as np
+import geometry_cache
+import instrument
 from color_wheel import ColorWheel
+from progressive import ProgressiveRenderer
+from sampling import get_adaptive_parameters, stats as sampling_stats
 
 
 class Trochoid:
-    def __init__(self, center=(0, 0)):
-        self.turtle = turtle.Turtle()
-        self.screen = self.turtle.getscreen()
-        self.center = turtle.Vec2D(center[0], center[1])
+    def __init__(self, center=(0, 0), pen=None):
+        # pen may be any object with the turtle.Turtle drawing interface,
+        # for example a headless.HeadlessTurtle. Without one, a Tk turtle
+        # is created on first use, so computing the path never needs Tk.
+        self._turtle = None
+        self.center = (float(center[0]), float(center[1]))
 
         self._steps_per_turn = 720
         self._pen_sign = -1
@@ -19,12 +25,44 @@ class Trochoid:
         self.set_radii(200, 70)
         self._color_wheel = ColorWheel(self._steps)
 
+        # When batched, runs of segments that share a color are drawn as one
+        # canvas line item, with colors quantized to color_buckets hues.
+        self.batched = False
+        self.color_buckets = 256
+
+        # 'uniform' steps by a fixed angle. 'adaptive' places points by
+        # curvature so that chords stay within tolerance pixels of the
+        # curve, and sets points_saved to the number of points it avoided.
+        self.sampling = 'uniform'
+        self.tolerance = 0.25
+        self.points_saved = 0
+
+        self._renderer = None
+
+        if pen is not None:
+            self.turtle = pen
+
+    @property
+    def turtle(self):
+        if self._turtle is None:
+            import turtle
+            self.turtle = turtle.Turtle()
+
+        return self._turtle
+
+    @turtle.setter
+    def turtle(self, pen):
+        self._turtle = pen
         self.screen.bgcolor('black')
         self.turtle.shape('turtle')
         self.turtle.color('red')
         self.turtle.speed(0)
         self.screen.tracer(5)
 
+    @property
+    def screen(self):
+        return self.turtle.getscreen()
+
     @property
     def is_epitrochoid(self) -> bool:
         return self._pen_sign == 1
@@ -88,10 +126,9 @@ class Trochoid:
         self._turns = pen_radius / math.gcd(arm_radius, pen_radius)
 
         # Calculate _steps_per_turn to ensure smoothness
-        self._angle_delta = tt.get_smooth_angle_delta(
-            self._rolling_radius + self._scaled_pen_radius)
-
-        self._steps_per_turn = int(math.ceil(2 * math.pi / self._angle_delta))
+        radius = self._rolling_radius + self._scaled_pen_radius
+        self._angle_delta = tt.get_smooth_angle_delta(radius)
+        self._steps_per_turn = int(tt.get_smooth_step_counts(radius))
         self._steps = int(math.ceil(self._turns * self._steps_per_turn))
 
     def erase(self):
@@ -101,7 +138,6 @@ class Trochoid:
         speed = self.turtle.speed()
         tracer = self.screen.tracer()
         self.turtle.reset()
-        self.screen = self.turtle.getscreen()
         self.screen.bgcolor(bgcolor)
         self.turtle.shape(shape)
         self.turtle.color(*color)
@@ -115,15 +151,112 @@ class Trochoid:
         return arm + pen
 
     def calculate_position(self, angle):
-        return turtle.Vec2D(
+        from turtle import Vec2D
+
+        return Vec2D(
             self.calculate_orthogonal_position(math.cos, angle),
             self.calculate_orthogonal_position(math.sin, angle))
 
+    def _get_positions(self, angles):
+        arm_angles = self._arm_rate * angles
+        pen_angles = self._pen_rate * angles
+
+        path = np.empty((len(angles), 2))
+
+        path[:, 0] = \
+            self._rolling_radius * np.cos(arm_angles) \
+            + self._scaled_pen_radius * np.cos(pen_angles)
+
+        path[:, 1] = \
+            self._rolling_radius * np.sin(arm_angles) \
+            + self._scaled_pen_radius * np.sin(pen_angles)
+
+        return path
+
+    def _get_derivatives(self, angles):
+        """ Returns the first and second derivatives of the path. """
+        arm_angles = self._arm_rate * angles
+        pen_angles = self._pen_rate * angles
+        arm = self._rolling_radius * self._arm_rate
+        pen = self._scaled_pen_radius * self._pen_rate
+
+        velocities = np.stack((
+            -arm * np.sin(arm_angles) - pen * np.sin(pen_angles),
+            arm * np.cos(arm_angles) + pen * np.cos(pen_angles)), axis=1)
+
+        accelerations = np.stack((
+            -arm * self._arm_rate * np.cos(arm_angles)
+            - pen * self._pen_rate * np.cos(pen_angles),
+            -arm * self._arm_rate * np.sin(arm_angles)
+            - pen * self._pen_rate * np.sin(pen_angles)), axis=1)
+
+        return velocities, accelerations
+
+    def _compute_relative_path(self):
+        if self.sampling == 'adaptive':
+            # The uniform step count sets the density of the guide grid,
+            # which spans exactly one period so that the curve closes.
+            angles = np.linspace(0, 2 * math.pi * self._turns, self._steps)
+
+            angles = get_adaptive_parameters(
+                angles,
+                *self._get_derivatives(angles),
+                tolerance=self.tolerance)
+        else:
+            angles = np.arange(self._steps) * self._angle_delta
+
+        return self._get_positions(angles)
+
+    def compute_path(self):
+        """ Returns the whole curve as an (N, 2) array of absolute points. """
+        key = (
+            'trochoid',
+            self._pen_sign,
+            self._arm_radius,
+            self._pen_radius,
+            self._scale)
+
+        if self.sampling == 'adaptive':
+            key += ('adaptive', self.tolerance)
+        elif self.sampling != 'uniform':
+            raise ValueError(f'Unknown sampling mode: {self.sampling}')
+
+        path = geometry_cache.cache.get_or_compute(
+            key,
+            self._compute_relative_path)
+
+        if self.sampling == 'adaptive':
+            self.points_saved = sampling_stats.record(self._steps, len(path))
+        else:
+            self.points_saved = 0
+
+        return path + self.center
+
     def draw(self, rainbow_count=1):
-        self._color_wheel.set_period(self._steps / rainbow_count)
+        with instrument.phase('trochoid', 'geometry'):
+            path = self.compute_path()
+
+        self._color_wheel.set_period(len(path) / rainbow_count)
+        instrument.count('trochoid', 'segments', len(path) - 1)
+
+        if self.batched:
+            with instrument.phase('trochoid', 'draw', self.turtle):
+                self.draw_batched(path)
+
+            return
+
+        with instrument.phase('trochoid', 'geometry'):
+            headings = tt.get_headings(path)
+
+        with instrument.phase('trochoid', 'color'):
+            colors = self._color_wheel.colors_for(len(path)).tolist()
+
+        with instrument.phase('trochoid', 'draw', self.turtle):
+            self._draw_steps(path, headings, map(tuple, colors))
+
+    def _draw_steps(self, path, headings, colors):
         self.turtle.penup()
-        last_point = self.center + self.calculate_position(0)
-        self.turtle.setpos(last_point)
+        self.turtle.setpos(*path[0])
         self.turtle.pendown()
         speed = self.turtle.speed()
 
@@ -131,31 +264,74 @@ class Trochoid:
             # The turtle icon will be animated as it draws.
             # When speed is 0 or greater than 10, the turtle jumps to the next
             # position.
-            for i in range(self._steps):
-                current_point = self.center \
-                    + self.calculate_position(i * self._angle_delta)
-
-                self.turtle.setheading(
-                    tt.get_heading(current_point, last_point))
+            for i, (point, heading, color) in enumerate(
+                    zip(path.tolist(), headings.tolist(), colors)):
 
-                last_point = current_point
-                self.turtle.setpos(current_point)
-                self.turtle.color(self._color_wheel.get_next_color())
+                self.turtle.setheading(heading)
+                self.turtle.setpos(*point)
+                self.turtle.color(color)
 
                 if i % (2 * speed) == 0:
                     self.screen.update()
+                    instrument.count('trochoid', 'updates')
         else:
-            for i in range(self._steps):
-                current_point = \
-                    self.center \
-                    + self.calculate_position(i * self._angle_delta)
+            for point, heading, color in zip(
+                    path.tolist(), headings.tolist(), colors):
+
+                self.turtle.setheading(heading)
+                self.turtle.setpos(*point)
+                self.turtle.color(color)
+
+    def draw_batched(self, path):
+        self.turtle.penup()
+        self.turtle.setpos(*path[0])
+        self.turtle.pendown()
+
+        for start, stop, color in self._color_wheel.get_color_runs(
+                len(path) - 1,
+                self.color_buckets):
+
+            tt.draw_polyline(self.turtle, path[start:stop + 1], color)
+
+        self.screen.update()
+        instrument.count('trochoid', 'updates')
+
+    def iterate_color_runs(self, path):
+        """
+        Yields (points, color) chunks of path, one per run of one color, that
+        join into a single polyline.
+        """
+        for start, stop, color in self._color_wheel.get_color_runs(
+                len(path) - 1,
+                self.color_buckets):
+
+            if start == 0:
+                yield path[:stop + 1], color
+            else:
+                yield path[start + 1:stop + 1], color
+
+    def draw_progressive(self, rainbow_count=1, frame_time=1 / 60.0):
+        """
+        Draws the curve a frame at a time from the screen's event loop and
+        returns the ProgressiveRenderer, which can cancel it. A render still
+        in progress from an earlier call is cancelled first.
+        """
+        if self._renderer is not None:
+            self._renderer.cancel()
+
+        path = self.compute_path()
+        self._color_wheel.set_period(len(path) / rainbow_count)
+
+        self.turtle.penup()
+        self.turtle.setpos(*path[0])
+        self.turtle.pendown()
 
-                self.turtle.setheading(
-                    tt.get_heading(current_point, last_point))
+        self._renderer = ProgressiveRenderer(
+            self.turtle,
+            self.iterate_color_runs(path),
+            frame_time)
 
-                last_point = current_point
-                self.turtle.setpos(current_point)
-                self.turtle.color(self._color_wheel.get_next_color())
+        return self._renderer.start()
 
 
 if __name__ == '__main__':
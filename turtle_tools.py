@@ -1,13 +1,190 @@
 
-import turtle
 import math
 from contextlib import contextmanager
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    # Only for annotations, so that importing this module skips tkinter.
+    from turtle import Vec2D
 
-def get_heading(first: turtle.Vec2D, second: turtle.Vec2D) -> float:
+
+def get_heading(first: 'Vec2D', second: 'Vec2D') -> float:
     x, y = first - second
     return math.degrees(math.atan2(y, x))
 
 
+def get_headings(points, start=None):
+    """
+    Returns the heading, in degrees, of each point of an (N, 2) array from
+    the point before it. The first point is headed from start, or is 0 when
+    start is None.
+    """
+    import numpy as np
+
+    points = np.asarray(points, dtype=np.float64)
+    start = points[:1] if start is None else np.reshape(start, (1, 2))
+    deltas = np.diff(points, axis=0, prepend=start)
+
+    return np.degrees(np.arctan2(deltas[:, 1], deltas[:, 0]))
+
+
 def get_smooth_angle_delta(radius, minimum_arc_pixels: float = 2.0) -> float:
     return abs(math.atan(minimum_arc_pixels / radius))
+
+
+def get_smooth_step_counts(radii, minimum_arc_pixels: float = 2.0):
+    """
+    Returns the number of get_smooth_angle_delta steps in one turn for each
+    of an array of radii, as integers.
+    """
+    import numpy as np
+
+    radii = np.abs(np.asarray(radii, dtype=np.float64))
+
+    with np.errstate(divide='ignore'):
+        angle_deltas = np.arctan(minimum_arc_pixels / radii)
+
+    return np.ceil(2 * math.pi / angle_deltas).astype(np.int64)
+
+
+def is_box_visible(left, bottom, right, top, viewport) -> bool:
+    """ viewport is (left, bottom, right, top), or None for everything. """
+    if viewport is None:
+        return True
+
+    return left <= viewport[2] and right >= viewport[0] \
+        and bottom <= viewport[3] and top >= viewport[1]
+
+
+def _draw_tk_line(pen, points) -> None:
+    """
+    Adds points to a Tk turtle's canvas as one connected line item in the
+    pen's color and width.
+
+    This relies on turtle internals (TurtleScreen._createline, _drawline,
+    _colorstr and RawTurtle.items) that CPython has kept stable but does
+    not document. It needs a display, so it has no automated coverage;
+    check it by running a demo with batched set.
+    """
+    screen = pen.getscreen()
+    item = screen._createline()
+
+    screen._drawline(
+        item,
+        [tuple(point) for point in points],
+        fill=screen._colorstr(pen.pencolor()),
+        width=pen.pensize())
+
+    # Registered with the turtle so that clear() and reset() remove it.
+    pen.items.append(item)
+
+
+def get_segment_walks(starts, ends) -> list:
+    """
+    Returns one list of points for each connected group of segments, that
+    passes along every segment of the group and goes back over segments it
+    has already drawn to reach the rest.
+
+    In one pen color and width the retraced parts look the same, so each
+    walk can be drawn as a single connected line. Chord sets, like those
+    of LineSetMixin.draw_chords, meet at their shared points and make a
+    handful of groups.
+    """
+    starts = [tuple(point) for point in starts.tolist()]
+    ends = [tuple(point) for point in ends.tolist()]
+
+    # The unused segments at each point, with the point at their far end.
+    edges = {}
+
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        edges.setdefault(start, []).append((i, end))
+        edges.setdefault(end, []).append((i, start))
+
+    used = [False] * len(starts)
+    walks = []
+
+    for first in range(len(starts)):
+        if used[first]:
+            continue
+
+        # Depth first, stepping back along the path when a point has no
+        # unused segments left.
+        walk = [starts[first]]
+        path = [starts[first]]
+        drawn_length = 1
+
+        while path:
+            point = path[-1]
+            point_edges = edges[point]
+
+            while point_edges and used[point_edges[-1][0]]:
+                point_edges.pop()
+
+            if point_edges:
+                i, other = point_edges.pop()
+                used[i] = True
+                path.append(other)
+                walk.append(other)
+                drawn_length = len(walk)
+            else:
+                path.pop()
+
+                if path:
+                    walk.append(path[-1])
+
+        # Stepping back to the start after the last new segment is wasted.
+        walks.append(walk[:drawn_length])
+
+    return walks
+
+
+def draw_polyline(pen, points, color=None) -> None:
+    """
+    Draws points as a single connected line item instead of one item per
+    segment, and leaves the pen at the last point. Like setpos, nothing is
+    drawn while the pen is up.
+
+    pen is a turtle.Turtle or any pen that provides its own draw_polyline,
+    like headless.HeadlessTurtle.
+    """
+    if len(points) < 2:
+        return
+
+    if color is not None:
+        pen.pencolor(color)
+
+    if hasattr(pen, 'draw_polyline'):
+        pen.draw_polyline(points)
+        return
+
+    is_down = pen.isdown()
+
+    if is_down:
+        _draw_tk_line(pen, points.tolist())
+
+    pen.penup()
+    pen.setpos(*points[-1])
+
+    if is_down:
+        pen.pendown()
+
+
+def draw_segments(pen, starts, ends, color=None) -> None:
+    """
+    Draws unconnected segments from starts to ends, both (N, 2) arrays, in
+    one pass without moving the turtle between them.
+
+    pen is a turtle.Turtle or any pen that provides its own draw_segments,
+    like headless.HeadlessTurtle. A Tk line item is always connected, so
+    on a Tk turtle the segments are drawn as one item per walk of
+    get_segment_walks.
+    """
+    if color is not None:
+        pen.pencolor(color)
+
+    if hasattr(pen, 'draw_segments'):
+        pen.draw_segments(starts, ends)
+        return
+
+    for walk in get_segment_walks(starts, ends):
+        _draw_tk_line(pen, walk)